@@ -2723,20 +2723,16 @@ def delete_record_translations(cr, module, xml_ids, field_list=None):
                     ),
                 )
             else:
-                name_comparisons = " OR ".join(
-                    ["name = %s" % (model + "," + field) for field in field_list]
-                )
                 query = """
                     DELETE FROM ir_translation
-                    WHERE module = %s AND ({name_comparison}) AND res_id = %s;
-                """.format(
-                    name_comparison=name_comparisons
-                )
+                    WHERE module = %s AND name = ANY(%s) AND res_id = %s;
+                """
                 logged_query(
                     cr,
                     query,
                     (
                         module,
+                        [model + "," + field for field in field_list],
                         record_id,
                     ),
                 )
@@ -5,6 +5,9 @@
 the >=16.0 migration.
 """
 import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from itertools import product
 
 from psycopg2 import sql
@@ -57,6 +60,9 @@ def migrate_translations_to_jsonb(env, fields_spec):
     if rename_translation_table:
         logged_query(env.cr, "ALTER TABLE ir_translation RENAME TO _ir_translation")
     if table_exists(env.cr, "_ir_translation"):
+        # Several translatable fields usually live in the same table, so
+        # only query its columns once
+        table_columns = {}
         for model, field_name in fields_spec:
             table = get_model2table(model)
             if not table_exists(env.cr, table):
@@ -66,11 +72,15 @@ def migrate_translations_to_jsonb(env, fields_spec):
                 )
                 continue
             # Convert columns if needed
-            columns = tools.sql.table_columns(env.cr, table)
+            if table not in table_columns:
+                table_columns[table] = tools.sql.table_columns(env.cr, table)
+            columns = table_columns[table]
             if columns.get(field_name, {}).get("udt_name", "") in ["varchar", "text"]:
                 tools.sql.convert_column_translatable(
                     env.cr, table, field_name, "jsonb"
                 )
+                # The column type has changed, so fetch them again next time
+                del table_columns[table]
             field = env[model]._fields[field_name]
             # Ignore cleanup queries as we want to keep the original ir_translation
             # table records in order to be able to fix possible inconsistencies once
@@ -319,7 +329,46 @@ _ODOO16_REPLACEMENTS = (
     ),
 )
 
-ALL_REPLACEMENTS = _BS5_REPLACEMENTS + _ODOO16_REPLACEMENTS
+
+def _dedup_key(replacement):
+    """Hashable representation of a replacement spec."""
+    return tuple(sorted((key, repr(value)) for key, value in replacement.items()))
+
+
+def _dedup_replacements(replacements):
+    """Remove repeated replacements, as each one means a full pass over the
+    HTML tree for every converted string, keeping their order."""
+    seen = set()
+    result = []
+    for replacement in replacements:
+        key = _dedup_key(replacement)
+        if key not in seen:
+            seen.add(key)
+            result.append(replacement)
+    return tuple(result)
+
+
+ALL_REPLACEMENTS = _dedup_replacements(_BS5_REPLACEMENTS + _ODOO16_REPLACEMENTS)
+
+
+def _replacement_tokens(replacement):
+    """Yield the class and attribute names a node needs to match a replacement."""
+    yield from replacement.get("class_rm", "").split()
+    yield from replacement.get("attr_rp") or {}
+    yield from replacement.get("class_rp_by_inline") or {}
+
+
+# Every replacement requires one of these tokens to be present in the HTML, so
+# strings not containing any of them can be skipped without parsing them
+_BS4_TOKEN_RE = re.compile(
+    "|".join(
+        map(
+            re.escape,
+            sorted({tok for r in ALL_REPLACEMENTS for tok in _replacement_tokens(r)}),
+        )
+    ),
+    re.IGNORECASE,
+)
 
 
 def convert_string_bootstrap_4to5(html_string, pretty_print=True):
@@ -334,7 +383,7 @@ def convert_string_bootstrap_4to5(html_string, pretty_print=True):
     :return str:
         Raw HTML fragment converted.
     """
-    if not html_string:
+    if not html_string or not _BS4_TOKEN_RE.search(html_string):
         return html_string
     try:
         return convert_html_fragment(
@@ -348,7 +397,7 @@ def convert_string_bootstrap_4to5(html_string, pretty_print=True):
 
 
 def convert_field_bootstrap_4to5(
-    env, model_name, field_name, domain=None, method="orm"
+    env, model_name, field_name, domain=None, method="orm", pretty_print=False
 ):
     """This converts all the values for the given model and field, being
     able to restrict to a domain of affected records.
@@ -359,6 +408,9 @@ def convert_field_bootstrap_4to5(
     :param domain: Optional domain for filtering records in the model
     :param method: 'orm' (default) for using ORM; 'sql' for avoiding problems
         with extra triggers in ORM.
+    :param pretty_print: Indicate if you wish to store the HTML pretty
+        formatted. Disabled by default, as indenting the stored HTML is slower
+        and produces bigger updates (and WAL) for no benefit when rendering.
     """
     assert method in {"orm", "sql"}
     if method == "orm":
@@ -367,21 +419,26 @@ def convert_field_bootstrap_4to5(
             model_name,
             field_name,
             domain,
+            pretty_print=pretty_print,
         )
     return _convert_field_bootstrap_4to5_sql(
         env.cr,
         env[model_name]._table,
         field_name,
+        pretty_print=pretty_print,
     )
 
 
-def _convert_field_bootstrap_4to5_orm(env, model_name, field_name, domain=None):
+def _convert_field_bootstrap_4to5_orm(
+    env, model_name, field_name, domain=None, pretty_print=False
+):
     """Convert a field from Bootstrap 4 to 5, using Odoo ORM.
 
     :param odoo.api.Environment env: Environment to use.
     :param str model_name: Model to update.
     :param str field_name: Field to convert in that model.
     :param domain list: Domain to restrict conversion.
+    :param bool pretty_print: Store the HTML pretty formatted.
     """
     # No class attribute will imply that no bootstrap conversion is needed at all
     domain = expression.AND([domain or [], [(field_name, "ilike", "class=")]])
@@ -389,11 +446,11 @@ def _convert_field_bootstrap_4to5_orm(env, model_name, field_name, domain=None):
     update_field_multilang(
         records,
         field_name,
-        lambda old, *a, **k: convert_string_bootstrap_4to5(old),
+        lambda old, *a, **k: convert_string_bootstrap_4to5(old, pretty_print),
     )
 
 
-def _convert_field_bootstrap_4to5_sql(cr, table, field, ids=None):
+def _convert_field_bootstrap_4to5_sql(cr, table, field, ids=None, pretty_print=False):
     """Convert a field from Bootstrap 4 to 5, using raw SQL queries.
 
     TODO Support multilang fields.
@@ -409,6 +466,9 @@ def _convert_field_bootstrap_4to5_sql(cr, table, field, ids=None):
 
     :param list ids:
         List of IDs, to restrict operation to them.
+
+    :param bool pretty_print:
+        Store the HTML pretty formatted.
     """
     query = "SELECT id, {field} FROM {table}"
     format_query_args = {"field": sql.Identifier(field), "table": sql.Identifier(table)}
@@ -416,27 +476,46 @@ def _convert_field_bootstrap_4to5_sql(cr, table, field, ids=None):
     if ids:
         query = f"{query} WHERE id IN %s"
         params = (tuple(ids),)
+    # Translatable fields are stored as jsonb, so decide once how to convert
+    # the values instead of checking the type of each one
+    cr.execute(
+        """
+        SELECT udt_name
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+            AND table_name = %s AND column_name = %s
+        """,
+        (table, field),
+    )
+    row = cr.fetchone()
+    is_json = bool(row) and row[0] in ("json", "jsonb")
     cr.execute(sql.SQL(query).format(**format_query_args), params)
-    for id_, old_content in cr.fetchall():
-        if type(old_content) == dict:
-            new_content = Json(
-                {
-                    key: convert_string_bootstrap_4to5(value)
-                    for key, value in old_content.items()
-                }
-            )
-        else:
-            new_content = convert_string_bootstrap_4to5(old_content)
-        if old_content != new_content:
-            cr.execute(
-                sql.SQL("UPDATE {table} SET {field} = %s WHERE id = %s").format(
-                    **format_query_args
-                ),
-                (
-                    new_content,
-                    id_,
-                ),
-            )
+    update_query = sql.SQL("UPDATE {table} SET {field} = %s WHERE id = %s").format(
+        **format_query_args
+    )
+    rows = cr.fetchall()
+    row_ids = [row[0] for row in rows]
+    old_contents = [row[1] for row in rows]
+
+    def _convert(old_content):
+        if not is_json:
+            return convert_string_bootstrap_4to5(old_content, pretty_print)
+        if not isinstance(old_content, dict):
+            return old_content
+        return {
+            key: convert_string_bootstrap_4to5(value, pretty_print)
+            for key, value in old_content.items()
+        }
+
+    # lxml releases the GIL while parsing and serializing, so convert the
+    # values in several threads, while updating them in order in this one
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+        new_contents = executor.map(_convert, old_contents)
+        for id_, old_content, new_content in zip(row_ids, old_contents, new_contents):
+            if old_content != new_content:
+                cr.execute(
+                    update_query, (Json(new_content) if is_json else new_content, id_)
+                )
 
 
 def fill_analytic_distribution(
@@ -466,15 +545,27 @@ def fill_analytic_distribution(
         env.cr,
         f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} jsonb",
     )
+    logged_query(env.cr, f"ANALYZE {table}")
+    # Percentages of the same account are summed through a window sorted the
+    # same way as the final aggregation, so everything is done in one pass
     logged_query(
         env.cr,
         f"""
         WITH distribution_data AS (
-            WITH sub AS (
-                SELECT
+            SELECT sub.line_id,
+            jsonb_object_agg(sub.analytic_account_id::text, sub.percentage)
+                AS analytic_distribution
+            FROM (
+                SELECT DISTINCT ON (
+                    all_line_data.line_id, all_line_data.analytic_account_id
+                )
                     all_line_data.line_id,
                     all_line_data.analytic_account_id,
-                    SUM(all_line_data.percentage) AS percentage
+                    SUM(all_line_data.percentage) OVER (
+                        PARTITION BY
+                            all_line_data.line_id,
+                            all_line_data.analytic_account_id
+                    ) AS percentage
                 FROM (
                     SELECT
                         line.id AS line_id,
@@ -500,12 +591,7 @@ def fill_analytic_distribution(
                             ON aat.id = tag_rel.{m2m_column2}
                     WHERE aat.active_analytic_distribution = true
                 ) AS all_line_data
-                GROUP BY all_line_data.line_id, all_line_data.analytic_account_id
-            )
-            SELECT sub.line_id,
-            jsonb_object_agg(sub.analytic_account_id::text, sub.percentage)
-                AS analytic_distribution
-            FROM sub
+            ) AS sub
             GROUP BY sub.line_id
         )
         UPDATE {table} line
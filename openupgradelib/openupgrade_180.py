@@ -43,21 +43,32 @@ def convert_company_dependent(
         f"ALTER TABLE {Model._table} ADD COLUMN IF NOT EXISTS {field_name} jsonb",
     )
 
+    # Stage the aggregated values in an indexed temporary table, and only
+    # rewrite the rows whose value actually changes
+    logged_query(env.cr, "DROP TABLE IF EXISTS pg_temp.ir_property_by_company")
+    logged_query(
+        env.cr,
+        f"""
+        CREATE TEMPORARY TABLE ir_property_by_company ON COMMIT DROP AS
+        SELECT
+        SPLIT_PART(res_id, ',', 2)::integer res_id,
+        JSONB_OBJECT_AGG(company_id, {value_expression}) value
+        FROM ir_property
+        WHERE
+        fields_id={old_field_id or Field.id} AND res_id IS NOT NULL
+        AND company_id IS NOT NULL
+        GROUP BY res_id
+        """,
+    )
+    logged_query(env.cr, "CREATE INDEX ON ir_property_by_company (res_id)")
+    logged_query(env.cr, "ANALYZE ir_property_by_company")
     logged_query(
         env.cr,
         f"""
         UPDATE {Model._table} SET {field_name}=ir_property_by_company.value
-        FROM (
-            SELECT
-            SPLIT_PART(res_id, ',', 2)::integer res_id,
-            JSON_OBJECT_AGG(company_id, {value_expression}) value
-            FROM ir_property
-            WHERE
-            fields_id={old_field_id or Field.id} AND res_id IS NOT NULL
-            AND company_id IS NOT NULL
-            GROUP BY res_id
-        ) ir_property_by_company
+        FROM ir_property_by_company
         WHERE {Model._table}.id=ir_property_by_company.res_id
+        AND {Model._table}.{field_name} IS DISTINCT FROM ir_property_by_company.value
         """,
     )
 
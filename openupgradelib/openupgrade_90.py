@@ -5,6 +5,7 @@
 """This module provides simple tools for OpenUpgrade migration, specific for
 the 8.0 -> 9.0 migration.
 """
+import base64
 import logging
 import threading
 
@@ -28,7 +29,10 @@ def convert_binary_field_to_attachment(env, field_spec):
     This is done through Odoo ORM, because there's a lot of logic associated
     with guessing MIME type, format and length, file saving in store...
     that is doesn't worth to recreate it via SQL as there's not too much
-    performance problem.
+    performance problem. The only exception is when attachments are stored
+    in the database, where the data is copied directly through SQL without
+    going through Python. MIME type and checksum are computed afterwards
+    from the stored data, and resource name is not filled in this case.
 
     :param env: Odoo environment
     :param field_spec: A dictionary with the ORM model name as key, and as
@@ -41,6 +45,9 @@ def convert_binary_field_to_attachment(env, field_spec):
     """
     logger = logging.getLogger("OpenUpgrade")
     attachment_model = env["ir.attachment"]
+    location = (
+        env["ir.config_parameter"].sudo().get_param("ir_attachment.location", "file")
+    )
     for model_name in field_spec:
         model = env[model_name]
         for field, column in field_spec[model_name]:
@@ -50,37 +57,49 @@ def convert_binary_field_to_attachment(env, field_spec):
                 "Converting to attachment field {} from model {} stored in "
                 "column {}".format(field, model_name, column)
             )
-            last_id = 0
-            while True:
-                env.cr.execute(
-                    """SELECT id, {0} FROM {1}
-                    WHERE {0} IS NOT NULL AND id > {2}
-                    ORDER BY id LIMIT 500;
-                    """.format(
-                        column, model._table, last_id
-                    )
-                )
-                rows = env.cr.fetchall()
-                if not rows:
-                    break
-                logger.info(
-                    "  converting {0} items starting after {1}..."
-                    "".format(len(rows), last_id)
+            if location == "db":
+                _convert_binary_column_to_db_attachment(
+                    env, model_name, model._table, field, column
                 )
-                for row in rows:
-                    last_id = row[0]
-                    data = bytes(row[1])
-                    if data and data != "None":
-                        attachment_model.create(
-                            {
-                                "name": field,
-                                "res_model": model_name,
-                                "res_field": field,
-                                "res_id": last_id,
-                                "type": "binary",
-                                "datas": data,
-                            }
+            else:
+                last_id = 0
+                while True:
+                    env.cr.execute(
+                        """SELECT id, {0} FROM {1}
+                        WHERE {0} IS NOT NULL AND id > {2}
+                        ORDER BY id LIMIT 500;
+                        """.format(
+                            column, model._table, last_id
                         )
+                    )
+                    rows = env.cr.fetchall()
+                    if not rows:
+                        break
+                    logger.info(
+                        "  converting {0} items starting after {1}..."
+                        "".format(len(rows), last_id)
+                    )
+                    vals_list = []
+                    for row in rows:
+                        last_id = row[0]
+                        data = bytes(row[1])
+                        if data and data != "None":
+                            vals_list.append(
+                                {
+                                    "name": field,
+                                    "res_model": model_name,
+                                    "res_field": field,
+                                    "res_id": last_id,
+                                    "type": "binary",
+                                    "datas": data,
+                                }
+                            )
+                    if openupgrade.version_info[0] >= 12:
+                        # Batch creation is supported since 12.0
+                        attachment_model.create(vals_list)
+                    else:
+                        for vals in vals_list:
+                            attachment_model.create(vals)
             # Remove source column for cleaning the room
             env.cr.execute(
                 "ALTER TABLE {} DROP COLUMN {}".format(
@@ -90,6 +109,57 @@ def convert_binary_field_to_attachment(env, field_spec):
             )
 
 
+def _convert_binary_column_to_db_attachment(env, model_name, table, field, column):
+    """Copy the contents of a binary column to attachments stored in the
+    database, without going through the ORM. Binary columns contain the
+    base64 encoded value, which is the same format that db_datas uses.
+
+    Postgres can't compute the SHA-1 checksum nor guess the MIME type, so
+    they are filled afterwards in one pass over the new attachments, which
+    only reads their data.
+    """
+    decoded = "decode(convert_from({}.{}, 'UTF8'), 'base64')".format(table, column)
+    openupgrade.logged_query(
+        env.cr,
+        """
+        INSERT INTO ir_attachment (
+            name, res_model, res_field, res_id, type, db_datas, file_size,
+            create_uid, create_date, write_uid, write_date
+        )
+        SELECT %(field)s, %(model_name)s, %(field)s, {table}.id, 'binary',
+            {table}.{column}, octet_length({decoded}),
+            %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+        FROM {table}
+        WHERE {table}.{column} IS NOT NULL
+            AND octet_length({table}.{column}) > 0
+            AND {table}.{column} != 'None'::bytea
+        RETURNING id
+        """.format(
+            table=table,
+            column=column,
+            decoded=decoded,
+        ),
+        {"field": field, "model_name": model_name, "uid": env.uid},
+    )
+    attachment_ids = [row[0] for row in env.cr.fetchall()]
+    attachment_model = env["ir.attachment"]
+    for i in range(0, len(attachment_ids), 500):
+        env.cr.execute(
+            "SELECT id, db_datas FROM ir_attachment WHERE id IN %s",
+            (tuple(attachment_ids[i : i + 500]),),
+        )
+        for attachment_id, datas in env.cr.fetchall():
+            datas = bytes(datas)
+            env.cr.execute(
+                "UPDATE ir_attachment SET checksum = %s, mimetype = %s WHERE id = %s",
+                (
+                    attachment_model._compute_checksum(base64.b64decode(datas)),
+                    attachment_model._compute_mimetype({"datas": datas}),
+                    attachment_id,
+                ),
+            )
+
+
 def replace_account_types(env, type_spec, unlink=True):
     """ Replace old account types with their replacements. The old account
     type is allowed not to exist anymore, except when running unit tests.
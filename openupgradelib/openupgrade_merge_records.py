@@ -3,18 +3,331 @@
 # Copyright 2018 Opener B.V. - Stefan Rijnhart
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-import functools
+import io
 import logging
+from contextlib import contextmanager
 
 from psycopg2 import IntegrityError, ProgrammingError, sql
 from psycopg2.errorcodes import UNDEFINED_COLUMN, UNIQUE_VIOLATION
 from psycopg2.extensions import AsIs
 
 from .openupgrade import get_model2table, logged_query, version_info
-from .openupgrade_tools import column_exists, table_exists
+from .openupgrade_tools import column_exists, invalidate_cache
 
 logger = logging.getLogger("OpenUpgrade")
-logger.setLevel(logging.DEBUG)
+
+# From this amount of merged records, their ids are staged in a temporary
+# table for joining with it, instead of being bound as a query parameter
+_STAGE_IDS_THRESHOLD = 1000
+
+# Maximum amount of merged records handled by each statement of the SQL method
+_MERGE_BATCH_SIZE = 10000
+
+
+def _stage_ids(cr, ids):
+    """Copy the given ids in a temporary table, for joining big sets of ids.
+
+    :return: SQL expression selecting the staged ids, usable as parameter
+      value in place of the tuple of ids in ``IN %s`` conditions.
+    """
+    cr.execute(
+        "CREATE TEMPORARY TABLE IF NOT EXISTS merge_records_ids "
+        "(id integer PRIMARY KEY) ON COMMIT DROP"
+    )
+    cr.execute("TRUNCATE merge_records_ids")
+    cr.copy_expert(
+        "COPY merge_records_ids FROM STDIN",
+        io.StringIO("\n".join(str(x) for x in set(ids))),
+    )
+    cr.execute("ANALYZE merge_records_ids")
+    return AsIs("(SELECT id FROM merge_records_ids)")
+
+
+def _invalidate_cache(env, flush=True):
+    """Invalidate the whole cache, calling directly the ORM method on the
+    versions where it exists, as invalidate_cache warns on untested ones."""
+    if version_info[0] >= 16:
+        env.invalidate_all(flush=flush)
+    else:
+        invalidate_cache(env, flush=flush)
+
+
+def _get_unique_indexes(cr, tables):
+    """Get the unique indexes of the given tables in one query.
+
+    Only key columns are returned, not the ones added with INCLUDE. Indexes
+    with expressions, a predicate or NULLS NOT DISTINCT aren't plain.
+
+    :return: dictionary with table names as keys and a list of
+      (is plain index, list of columns) tuples as values.
+    """
+    # indnkeyatts (PG 11) and indnullsnotdistinct (PG 15) are read through
+    # to_jsonb for supporting older servers
+    cr.execute(
+        """
+        SELECT c.relname,
+            i.indexprs IS NULL AND i.indpred IS NULL AND NOT COALESCE(
+                (to_jsonb(i) ->> 'indnullsnotdistinct')::boolean, FALSE
+            ),
+            ARRAY(
+                SELECT a.attname::text
+                FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, n)
+                JOIN pg_attribute a
+                    ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                WHERE k.n <= COALESCE(
+                    (to_jsonb(i) ->> 'indnkeyatts')::integer, i.indnatts
+                )
+            )
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indrelid
+        WHERE c.relname = ANY(%s) AND i.indisunique
+        """,
+        (list(tables),),
+    )
+    indexes = {}
+    for table, plain, cols in cr.fetchall():
+        indexes.setdefault(table, []).append((plain, cols))
+    return indexes
+
+
+def _get_unique_index_columns(indexes, column):
+    """Get, for each unique index including the given column, the rest of
+    columns of the index, if all of them are plain indexes over columns.
+
+    :param indexes: unique indexes of the table, as returned by
+      _get_unique_indexes.
+    :return: list of lists of column names, or None if the possible
+      conflicts can't be determined this way.
+    """
+    indexes = [(plain, cols) for plain, cols in indexes if column in cols]
+    if not indexes or not all(plain for plain, _ in indexes):
+        return None
+    return [[x for x in cols if x != column] for _, cols in indexes]
+
+
+def _get_conflict_free_update_query(table, column, index_columns, extra_where):
+    """Get the query updating in one go the rows that won't collide with an
+    existing row of the target record, nor among them, on any of the unique
+    indexes (given by the rest of their columns, as returned by
+    _get_unique_index_columns).
+
+    As in the unique indexes, NULL values are distinct: rows with NULL in
+    any of the other columns of an index can't collide on it.
+    """
+    table_id = sql.Identifier(table)
+    query = _FOREIGN_KEY_REFS_CONFLICT_FREE_UPDATE.format(
+        table=table_id,
+        column=sql.Identifier(column),
+        ranks=sql.SQL(", ").join(
+            sql.SQL(
+                "CASE WHEN {any_null} THEN 1 ELSE "
+                "ROW_NUMBER() OVER ({partition} ORDER BY ctid) END AS rank{index}"
+            ).format(
+                any_null=sql.SQL(" OR ").join(
+                    sql.SQL("{} IS NULL").format(sql.Identifier(col))
+                    for col in other_columns
+                )
+                if other_columns
+                else sql.SQL("FALSE"),
+                partition=sql.SQL("PARTITION BY {}").format(
+                    sql.SQL(", ").join(map(sql.Identifier, other_columns))
+                )
+                if other_columns
+                else sql.SQL(""),
+                index=sql.SQL(str(index)),
+            )
+            for index, other_columns in enumerate(index_columns)
+        ),
+        no_conflicts=sql.SQL(" ").join(
+            sql.SQL(
+                """AND NOT EXISTS (
+                SELECT 1 FROM {table} t2
+                WHERE t2.{column} = %(target_record_id)s {conflict})"""
+            ).format(
+                table=table_id,
+                column=sql.Identifier(column),
+                conflict=sql.SQL(" ").join(
+                    sql.SQL("AND t2.{col} = {table}.{col}").format(
+                        table=table_id, col=sql.Identifier(col)
+                    )
+                    for col in other_columns
+                ),
+            )
+            for other_columns in index_columns
+        ),
+        first_ranks=sql.SQL(" AND ").join(
+            sql.SQL("rank{} = 1").format(sql.SQL(str(index)))
+            for index in range(len(index_columns))
+        ),
+        extra_where=sql.SQL(extra_where or ""),
+    )
+    return query
+
+
+def _change_foreign_key_refs_by_row(env, table, column, record_ids, target_record_id):
+    """Set the rows by batches, splitting in halves the batches violating a
+    unique constraint until isolating the offending rows, which are skipped.
+    This way, only a few statements are needed when conflicts are scarce.
+
+    Rows are identified by their ctid, which works for relation tables too,
+    and doesn't change for the rows not updated yet."""
+    format_args = {
+        "table": sql.Identifier(table),
+        "column": sql.Identifier(column),
+    }
+    env.cr.execute(
+        sql.SQL(
+            "SELECT ctid::text FROM {table} WHERE {column} IN %s ORDER BY ctid"
+        ).format(**format_args),
+        (tuple(record_ids),),
+    )
+    values = [x[0] for x in env.cr.fetchall()]
+    # The update of all the rows at once has already failed
+    batches = [values[len(values) // 2 :], values[: len(values) // 2]]
+    while batches:
+        batch = batches.pop()
+        if not batch:
+            continue
+        env.cr.execute("SAVEPOINT sp2")
+        try:
+            logged_query(
+                env.cr,
+                sql.SQL(
+                    "UPDATE {table} SET {column} = %s WHERE ctid = ANY(%s::tid[])"
+                ).format(**format_args),
+                (target_record_id, batch),
+            )
+        except (ProgrammingError, IntegrityError) as error:
+            env.cr.execute("ROLLBACK TO SAVEPOINT sp2")
+            if error.pgcode != UNIQUE_VIOLATION:
+                raise
+            if len(batch) > 1:
+                half = len(batch) // 2
+                batches += [batch[half:], batch[:half]]
+        else:
+            env.cr.execute("RELEASE SAVEPOINT sp2")
+
+
+def _change_relation_table_refs(
+    env, table, column, record_ids, target_record_id, query_args
+):
+    """Set the target record in a relation table through set operations,
+    removing first the rows that would be duplicated after the change.
+
+    If another unique constraint is still violated, the rows are moved one
+    by one, and the ones that can't be merged are removed."""
+    env.cr.execute(
+        """SELECT att.attname::text
+        FROM pg_attribute att
+        JOIN pg_class cl ON cl.oid = att.attrelid
+        WHERE cl.relname = %s AND att.attnum > 0 AND NOT att.attisdropped
+        AND att.attname != %s
+        """,
+        (table, column),
+    )
+    other_columns = [x[0] for x in env.cr.fetchall()]
+    format_args = {
+        "table": sql.Identifier(table),
+        "column": sql.Identifier(column),
+        "same_row": sql.SQL(" AND ").join(
+            sql.SQL("a.{col} IS NOT DISTINCT FROM b.{col}").format(
+                col=sql.Identifier(col)
+            )
+            for col in other_columns
+        )
+        if other_columns
+        else sql.SQL("TRUE"),
+    }
+    env.cr.execute("SAVEPOINT sp3")
+    try:
+        # Rows duplicating one of the target record, or another source row
+        logged_query(
+            env.cr,
+            sql.SQL(
+                """DELETE FROM {table} a
+                USING {table} b
+                WHERE a.{column} IN %(record_ids)s AND {same_row}
+                AND (
+                    b.{column} = %(target_record_id)s
+                    OR (b.{column} IN %(record_ids)s AND b.ctid < a.ctid)
+                )"""
+            ).format(**format_args),
+            query_args,
+            skip_no_result=True,
+        )
+        logged_query(
+            env.cr,
+            sql.SQL(
+                """UPDATE {table}
+                SET {column} = %(target_record_id)s
+                WHERE {column} IN %(record_ids)s"""
+            ).format(**format_args),
+            query_args,
+            skip_no_result=True,
+        )
+    except IntegrityError as error:
+        env.cr.execute("ROLLBACK TO SAVEPOINT sp3")
+        env.cr.execute("RELEASE SAVEPOINT sp3")
+        if error.pgcode != UNIQUE_VIOLATION:
+            raise
+    else:
+        env.cr.execute("RELEASE SAVEPOINT sp3")
+        return
+    _change_foreign_key_refs_by_row(env, table, column, record_ids, target_record_id)
+    # delete remaining values that could not be merged
+    logged_query(
+        env.cr,
+        sql.SQL("DELETE FROM {table} WHERE {column} IN %(record_ids)s").format(
+            **format_args
+        ),
+        query_args,
+        skip_no_result=True,
+    )
+
+
+def _get_foreign_key_refs(cr, model_table):
+    """Get the (table, column) pairs with a foreign key to the given table."""
+    cr.execute(
+        """SELECT cl.relname, att.attname
+        FROM pg_constraint con
+        JOIN pg_class cl ON cl.oid = con.conrelid
+        JOIN pg_attribute att
+            ON att.attrelid = con.conrelid AND att.attnum = con.conkey[1]
+        JOIN pg_attribute ref_att
+            ON ref_att.attrelid = con.confrelid AND ref_att.attnum = con.confkey[1]
+        WHERE con.contype = 'f'
+        AND con.confrelid = to_regclass(quote_ident(%s))
+        AND ref_att.attname = 'id'
+        """,
+        (model_table,),
+    )
+    return cr.fetchall()
+
+
+# Query skeletons of _change_foreign_key_refs, bound to each table and column
+_FOREIGN_KEY_REFS_PROBE = sql.SQL(
+    "SELECT {index} WHERE EXISTS ("
+    "SELECT 1 FROM {table} WHERE {column} IN %(record_ids)s)"
+)
+_FOREIGN_KEY_REFS_UPDATE = sql.SQL(
+    """UPDATE {table}
+    SET {column} = %(target_record_id)s
+    WHERE {column} in %(record_ids)s"""
+)
+_FOREIGN_KEY_REFS_CONFLICT_FREE_UPDATE = sql.SQL(
+    """UPDATE {table}
+    SET {column} = %(target_record_id)s
+    WHERE ctid IN (
+        SELECT ctid FROM (
+            SELECT ctid, {ranks}
+            FROM {table}
+            WHERE {column} in %(record_ids)s
+            {no_conflicts}
+            {extra_where}
+        ) AS candidates
+        WHERE {first_ranks}
+    )"""
+)
 
 
 def _change_foreign_key_refs(
@@ -25,49 +338,98 @@ def _change_foreign_key_refs(
     exclude_columns,
     model_table,
     extra_where=None,
+    foreign_key_refs=None,
 ):
-    # As found on https://stackoverflow.com/questions/1152260
-    # /postgres-sql-to-list-table-foreign-keys
-    # Adapted for specific Odoo structures like many2many tables
+    if not record_ids:
+        return
+    if foreign_key_refs is None:
+        foreign_key_refs = _get_foreign_key_refs(env.cr, model_table)
+    refs = [
+        (table, column)
+        for table, column in foreign_key_refs
+        if (table, column) not in exclude_columns
+    ]
+    if not refs:
+        return
+    query_args = {
+        "record_ids": (
+            _stage_ids(env.cr, record_ids)
+            if len(record_ids) >= _STAGE_IDS_THRESHOLD
+            else tuple(record_ids)
+        ),
+        "target_record_id": target_record_id,
+    }
+    # Find in one query which tables have rows to be updated, for not
+    # locking nor updating the rest
     env.cr.execute(
-        """ SELECT tc.table_name, kcu.column_name
-            FROM information_schema.table_constraints AS tc
-            JOIN information_schema.key_column_usage AS kcu
-                ON tc.constraint_name = kcu.constraint_name
-                AND tc.table_schema = kcu.table_schema
-            JOIN information_schema.constraint_column_usage AS ccu
-                ON ccu.constraint_name = tc.constraint_name
-                AND ccu.table_schema = tc.table_schema
-            WHERE tc.constraint_type = 'FOREIGN KEY'
-            AND ccu.table_name = %s and ccu.column_name = 'id'
-        """,
-        (model_table,),
-    )
-    for table, column in env.cr.fetchall():
-        if (table, column) in exclude_columns:
-            continue
-        # Try one big swoop first
-        env.cr.execute("SAVEPOINT sp1")  # can't use env.cr.savepoint() in base
-        try:
-            query = sql.SQL(
-                """UPDATE {table}
-                SET {column} = %(target_record_id)s
-                WHERE {column} in %(record_ids)s"""
-            ).format(
+        sql.SQL(" UNION ALL ").join(
+            _FOREIGN_KEY_REFS_PROBE.format(
+                index=sql.Literal(index),
                 table=sql.Identifier(table),
                 column=sql.Identifier(column),
             )
-            if extra_where:
-                query += sql.SQL(extra_where)
-            logged_query(
-                env.cr,
-                query,
-                {
-                    "record_ids": tuple(record_ids),
-                    "target_record_id": target_record_id,
-                },
-                skip_no_result=True,
+            for index, (table, column) in enumerate(refs)
+        ),
+        query_args,
+    )
+    refs = [refs[row[0]] for row in sorted(env.cr.fetchall())]
+    if not refs:
+        return
+    queries = []
+    for table, column in refs:
+        query = _FOREIGN_KEY_REFS_UPDATE.format(
+            table=sql.Identifier(table),
+            column=sql.Identifier(column),
+        )
+        if extra_where:
+            query += sql.SQL(extra_where)
+        queries.append(query)
+    # Try to update all the tables in one round trip first
+    env.cr.execute("SAVEPOINT sp0")
+    try:
+        logged_query(env.cr, sql.SQL(";\n").join(queries), query_args)
+    except (ProgrammingError, IntegrityError) as error:
+        env.cr.execute("ROLLBACK TO SAVEPOINT sp0")
+        if error.pgcode != UNIQUE_VIOLATION and not (
+            error.pgcode == UNDEFINED_COLUMN and extra_where
+        ):
+            raise
+    else:
+        env.cr.execute("RELEASE SAVEPOINT sp0")
+        return
+    # Some table failed, so go table by table for knowing which ones
+    tables = {table for table, _ in refs}
+    unique_indexes = _get_unique_indexes(env.cr, tables)
+    # Relation tables are the ones without id column, checked in one query
+    env.cr.execute(
+        """SELECT cl.relname::text
+        FROM pg_attribute att
+        JOIN pg_class cl ON cl.oid = att.attrelid
+        WHERE cl.relname = ANY(%s) AND att.attname = 'id'
+        AND NOT att.attisdropped""",
+        (list(tables),),
+    )
+    tables_with_id = {x[0] for x in env.cr.fetchall()}
+    for (table, column), query in zip(refs, queries):
+        indexes = unique_indexes.get(table, [])
+        index_columns = _get_unique_index_columns(indexes, column)
+        relation_table = table not in tables_with_id
+        conflict_free = bool(
+            index_columns
+            and not relation_table
+            and all(plain for plain, _ in indexes)
+        )
+        if conflict_free:
+            # All the unique indexes of the table are plain ones, so skip
+            # directly the rows that would collide on them, instead of trying
+            # the plain update first in another subtransaction
+            query = _get_conflict_free_update_query(
+                table, column, index_columns, extra_where
             )
+        # Try one big swoop first
+        env.cr.execute("SAVEPOINT sp1")  # can't use env.cr.savepoint() in base
+        try:
+            logged_query(env.cr, query, query_args, skip_no_result=True)
         except (ProgrammingError, IntegrityError) as error:
             env.cr.execute("ROLLBACK TO SAVEPOINT sp1")
             if error.pgcode == UNDEFINED_COLUMN and extra_where:
@@ -75,133 +437,271 @@ def _change_foreign_key_refs(
                 continue
             elif error.pgcode != UNIQUE_VIOLATION:
                 raise
-            # Fallback on setting each row separately
-            m2m_table = not column_exists(env.cr, table, "id")
-            target_column = column if m2m_table else "id"
-            env.cr.execute(
-                """SELECT %(target_column)s FROM %(table)s
-                WHERE "%(column)s" in %(record_ids)s""",
-                {
-                    "target_column": AsIs(target_column),
-                    "table": AsIs(table),
-                    "column": AsIs(column),
-                    "record_ids": tuple(record_ids),
-                },
+        else:
+            env.cr.execute("RELEASE SAVEPOINT sp1")
+            continue
+        if relation_table:
+            # Relation table: remove the rows that would be duplicated
+            _change_relation_table_refs(
+                env, table, column, record_ids, target_record_id, query_args
             )
-            for row in list(set([x[0] for x in env.cr.fetchall()])):
-                env.cr.execute("SAVEPOINT sp2")
-                try:
-                    logged_query(
-                        env.cr,
-                        """UPDATE %(table)s
-                        SET "%(column)s" = %(target_record_id)s
-                        WHERE %(target_column)s = %(record_id)s""",
-                        {
-                            "target_column": AsIs(target_column),
-                            "table": AsIs(table),
-                            "column": AsIs(column),
-                            "record_id": row,
-                            "target_record_id": target_record_id,
-                        },
-                    )
-                except (ProgrammingError, IntegrityError) as error:
-                    env.cr.execute("ROLLBACK TO SAVEPOINT sp2")
-                    if error.pgcode != UNIQUE_VIOLATION:
-                        raise
-                else:
-                    env.cr.execute("RELEASE SAVEPOINT sp2")
-            if m2m_table:
-                # delete remaining values that could not be merged
+            continue
+        if index_columns and not conflict_free:
+            # Skip the rows that would collide on the unique indexes, instead
+            # of going row by row. Other constraints (like expression indexes)
+            # could still be violated, hence the savepoint.
+            env.cr.execute("SAVEPOINT sp1")
+            try:
                 logged_query(
                     env.cr,
-                    """DELETE FROM %(table)s
-                    WHERE "%(column)s" in %(record_ids)s""",
-                    {
-                        "table": AsIs(table),
-                        "column": AsIs(column),
-                        "record_ids": tuple(record_ids),
-                    },
+                    _get_conflict_free_update_query(
+                        table, column, index_columns, extra_where
+                    ),
+                    query_args,
                     skip_no_result=True,
                 )
-        else:
-            env.cr.execute("RELEASE SAVEPOINT sp1")
+            except IntegrityError as error:
+                env.cr.execute("ROLLBACK TO SAVEPOINT sp1")
+                if error.pgcode != UNIQUE_VIOLATION:
+                    raise
+            else:
+                env.cr.execute("RELEASE SAVEPOINT sp1")
+                continue
+        _change_foreign_key_refs_by_row(
+            env, table, column, record_ids, target_record_id
+        )
 
 
-def _change_many2one_refs_orm(
-    env, model_name, record_ids, target_record_id, exclude_columns
-):
-    fields = env["ir.model.fields"].search(
-        [
-            ("ttype", "=", "many2one"),
-            ("relation", "=", model_name),
-        ]
-    )
+def _collect_relational_fields(env, model_name):
+    """Get from the registry the stored fields that can reference records of
+    the model, without querying ``ir.model.fields``.
+
+    :return: dictionary with 'many2one', 'many2many' and 'reference' keys,
+      and the list of field objects of that type as values.
+    """
+    result = {"many2one": [], "many2many": [], "reference": []}
+    for model_cls in env.registry.values():
+        for field in model_cls._fields.values():
+            if not field.store or field.type not in result:
+                continue
+            if field.type == "reference" or field.comodel_name == model_name:
+                result[field.type].append(field)
+    if "ir.property" in env.registry:
+        result["reference"].append(env["ir.property"]._fields["value_reference"])
+    return result
+
+
+def _get_fields_by_model(env, fields, exclude_columns):
+    """Resolve once the models of the given fields, discarding SQL views,
+    invalid fields and excluded columns.
+
+    :return: dictionary with model names as keys and a tuple of the model
+      (prepared for searching) and the list of field names as values.
+    """
+    result = {}
     for field in fields:
-        try:
-            model = env[field.model].with_context(active_test=False)
-        except KeyError:
-            continue
-        field_name = field.name
+        if field.model_name not in result:
+            try:
+                model = env[field.model_name].with_context(
+                    active_test=False, prefetch_fields=False
+                )
+            except KeyError:
+                continue
+            result[field.model_name] = (model, [])
+        model, field_names = result[field.model_name]
         if (
-            not model._auto
-            or not model._fields.get(field_name)
-            or not field.store
-            or (model._table, field_name) in exclude_columns
+            model._auto
+            and model._fields.get(field.name)
+            and field.store
+            and (model._table, field.name) not in exclude_columns
         ):
-            continue  # Discard SQL views + invalid fields + non-stored fields
-        records = model.search([(field_name, "in", record_ids)])
-        if records:
-            records.write({field_name: target_record_id})
+            field_names.append(field.name)
+    return {key: value for key, value in result.items() if value[1]}
+
+
+def _search_any(model, field_names, value):
+    """Search the records having the value in any of the given fields."""
+    domain = ["|"] * (len(field_names) - 1)
+    domain += [(field_name, "in", value) for field_name in field_names]
+    return model.search(domain)
+
+
+def _change_many2one_refs_orm(
+    env,
+    model_name,
+    record_ids,
+    target_record_id,
+    exclude_columns,
+    fields=None,
+    fast_update=False,
+):
+    if fields is None:
+        fields = _collect_relational_fields(env, model_name)["many2one"]
+    targets = _get_fields_by_model(env, fields, exclude_columns)
+    for field_model, (model, field_names) in targets.items():
+        records = _search_any(model, field_names, record_ids)
+        if not records:
+            continue
+        _flush_model(model, field_names)
+        for field_name in field_names:
+            field = model._fields[field_name]
+            if not fast_update or field.compute or field.inverse or field.related:
+                # Keep the ORM semantics for fields having their own logic
+                changed = records.filtered(
+                    lambda x, f=field_name: x[f].id in record_ids
+                )
+                changed.write({field_name: target_record_id})
+            else:
+                changed = _change_many2one_column(
+                    env, model, field_name, records, record_ids, target_record_id
+                )
+            if not changed:
+                continue
             logger.debug(
                 "Changed %s record(s) in many2one field '%s' of model '%s'",
-                len(records),
+                len(changed),
                 field_name,
-                field.model,
+                field_model,
             )
 
 
-def _change_many2many_refs_orm(
-    env, model_name, record_ids, target_record_id, exclude_columns
+def _change_many2one_column(
+    env, model, field_name, records, record_ids, target_record_id
 ):
-    fields = env["ir.model.fields"].search(
-        [
-            ("ttype", "=", "many2many"),
-            ("relation", "=", model_name),
-        ]
+    """Change the value through SQL for avoiding the write overhead on lots
+    of records, and notify the ORM for recomputing the fields depending on it.
+
+    :return: the changed records.
+    """
+    changed = records.filtered(lambda x: x[field_name].id in record_ids)
+    if not changed:
+        return changed
+    if version_info[0] >= 14:
+        # Let the ORM collect the records depending on the old value
+        changed.modified([field_name], before=True)
+    env.cr.execute(
+        sql.SQL("UPDATE {table} SET {column} = %s WHERE id IN %s").format(
+            table=sql.Identifier(model._table),
+            column=sql.Identifier(field_name),
+        ),
+        (target_record_id, tuple(changed.ids)),
     )
-    for field in fields:
-        try:
-            model = env[field.model].with_context(active_test=False)
-        except KeyError:
+    _invalidate_cache(env)
+    changed.modified([field_name])
+    return changed
+
+
+def _change_many2many_refs_orm(
+    env,
+    model_name,
+    record_ids,
+    target_record_id,
+    exclude_columns,
+    fields=None,
+    fast_update=False,
+):
+    if fields is None:
+        fields = _collect_relational_fields(env, model_name)["many2many"]
+    targets = _get_fields_by_model(env, fields, exclude_columns)
+    for field_model, (model, field_names) in targets.items():
+        records = _search_any(model, field_names, record_ids)
+        if not records:
             continue
-        field_name = field.name
-        if (
-            not model._auto
-            or not model._fields.get(field_name)
-            or not field.store
-            or (model._table, field_name) in exclude_columns
-        ):
-            continue  # Discard SQL views + invalid fields + non-stored fields
-        records = model.search([(field_name, "in", record_ids)])
-        if records:
-            records.write(
-                {
-                    field_name: (
-                        [(3, x) for x in record_ids] + [(4, target_record_id)]
-                    ),
-                }
+        _flush_model(model, field_names)
+        # Group the records by the fields to change, for moving each group at
+        # once instead of one write per field
+        groups = {}
+        for record in records:
+            changed_fields = tuple(
+                f for f in field_names if any(x in record_ids for x in record[f].ids)
             )
+            if changed_fields:
+                groups.setdefault(changed_fields, []).append(record.id)
+        commands = [(3, x) for x in record_ids] + [(4, target_record_id)]
+        for changed_fields, ids in groups.items():
+            changed = model.browse(ids)
+            if fast_update:
+                for field_name in changed_fields:
+                    _change_many2many_relation(
+                        env, model, field_name, changed, record_ids, target_record_id
+                    )
+            else:
+                changed.write(dict.fromkeys(changed_fields, commands))
             logger.debug(
-                "Changed %s record(s) in many2many field '%s' of model '%s'",
-                len(records),
-                field_name,
-                field.model,
+                "Changed %s record(s) in many2many field(s) %s of model '%s'",
+                len(ids),
+                ", ".join("'%s'" % f for f in changed_fields),
+                field_model,
             )
 
 
-def _change_reference_refs_sql(
-    env, model_name, record_ids, target_record_id, exclude_columns
+def _change_many2many_relation(
+    env, model, field_name, records, record_ids, target_record_id
 ):
+    """Move the relations in the relation table through SQL, without
+    duplicating the ones the records already have with the target record,
+    and notify the ORM for recomputing the fields depending on it.
+
+    :return: the changed records.
+    """
+    field = model._fields[field_name]
+    if version_info[0] >= 14:
+        # Let the ORM collect the records depending on the old value
+        records.modified([field_name], before=True)
+    format_args = {
+        "table": sql.Identifier(field.relation),
+        "column1": sql.Identifier(field.column1),
+        "column2": sql.Identifier(field.column2),
+    }
+    query_args = {
+        "record_ids": tuple(record_ids),
+        "target_record_id": target_record_id,
+        "res_ids": tuple(records.ids),
+    }
+    logged_query(
+        env.cr,
+        sql.SQL(
+            """INSERT INTO {table} ({column1}, {column2})
+            SELECT DISTINCT rel.{column1}, %(target_record_id)s
+            FROM {table} rel
+            WHERE rel.{column1} IN %(res_ids)s
+            AND rel.{column2} IN %(record_ids)s
+            AND NOT EXISTS (
+                SELECT 1 FROM {table} rel2
+                WHERE rel2.{column1} = rel.{column1}
+                AND rel2.{column2} = %(target_record_id)s
+            )"""
+        ).format(**format_args),
+        query_args,
+        skip_no_result=True,
+    )
+    logged_query(
+        env.cr,
+        sql.SQL(
+            "DELETE FROM {table} "
+            "WHERE {column1} IN %(res_ids)s AND {column2} IN %(record_ids)s"
+        ).format(**format_args),
+        query_args,
+    )
+    _invalidate_cache(env)
+    records.modified([field_name])
+    return records
+
+
+_REFERENCE_REFS_UPDATE = sql.SQL(
+    """
+    UPDATE {table}
+    SET {assignments}
+    WHERE {where}"""
+)
+
+
+def _get_reference_columns(env, exclude_columns):
+    """Get the existing columns of reference fields, grouped by table.
+
+    :return: dictionary with table names as keys and the list of reference
+      columns of each table as values.
+    """
     cr = env.cr
     cr.execute(
         """
@@ -210,76 +710,126 @@ def _change_reference_refs_sql(
         WHERE ttype='reference'
         """
     )
-    rows = cr.fetchall()
-    if ("ir.property", "value_reference") not in rows:
-        rows.append(("ir.property", "value_reference"))
-    for row in rows:
+    rows = set(cr.fetchall())
+    rows.add(("ir.property", "value_reference"))
+    candidates = []
+    for field_model, column in rows:
         try:
-            model = env[row[0]]
+            model = env[field_model]
             if not model._auto:  # Discard SQL views
                 continue
             table = model._table
         except KeyError:
-            table = get_model2table(row[0])
-        if not table_exists(cr, table):
-            continue
-        column = row[1]
-        if not column_exists(cr, table, column) or ((table, column) in exclude_columns):
+            table = get_model2table(field_model)
+        if (table, column) not in exclude_columns:
+            candidates.append((table, column))
+    if not candidates:
+        return {}
+    # Check in one query which of the columns exist, instead of probing
+    # each table and column
+    cr.execute(
+        """
+        SELECT cl.relname::text, att.attname::text
+        FROM pg_attribute att
+        JOIN pg_class cl ON cl.oid = att.attrelid
+        JOIN UNNEST(%s::text[], %s::text[]) AS c(tbl, col)
+            ON cl.relname = c.tbl AND att.attname = c.col
+        WHERE NOT att.attisdropped
+        """,
+        ([x[0] for x in candidates], [x[1] for x in candidates]),
+    )
+    existing = set(cr.fetchall())
+    # Group the reference columns by table for updating each table once
+    columns_by_table = {}
+    for table, column in candidates:
+        if (table, column) not in existing:
             continue
-        where = " OR ".join(
-            ["%s = '%s,%s'" % (column, model_name, x) for x in record_ids]
-        )
-        logged_query(
-            cr,
-            """
-            UPDATE %s
-            SET %s = %s
-            WHERE %s
-            """,
-            (
-                AsIs(table),
-                AsIs(column),
-                "%s,%s" % (model_name, target_record_id),
-                AsIs(where),
-            ),
-            skip_no_result=True,
+        columns_by_table.setdefault(table, [])
+        if column not in columns_by_table[table]:
+            columns_by_table[table].append(column)
+    return columns_by_table
+
+
+def _change_reference_refs_sql(
+    env,
+    model_name,
+    record_ids,
+    target_record_id,
+    exclude_columns,
+    columns_by_table=None,
+):
+    if not record_ids:
+        return
+    cr = env.cr
+    if columns_by_table is None:
+        columns_by_table = _get_reference_columns(env, exclude_columns)
+    query_args = {
+        "target": "%s,%s" % (model_name, target_record_id),
+        "sources": ["%s,%s" % (model_name, x) for x in record_ids],
+    }
+    queries = []
+    for table, columns in columns_by_table.items():
+        if len(columns) == 1:
+            assignments = sql.SQL("{column} = %(target)s").format(
+                column=sql.Identifier(columns[0])
+            )
+        else:
+            assignments = sql.SQL(", ").join(
+                sql.SQL(
+                    "{column} = CASE WHEN {column} = ANY(%(sources)s) "
+                    "THEN %(target)s ELSE {column} END"
+                ).format(column=sql.Identifier(column))
+                for column in columns
+            )
+        queries.append(
+            _REFERENCE_REFS_UPDATE.format(
+                table=sql.Identifier(table),
+                assignments=assignments,
+                where=sql.SQL(" OR ").join(
+                    sql.SQL("{column} = ANY(%(sources)s)").format(
+                        column=sql.Identifier(column)
+                    )
+                    for column in columns
+                ),
+            )
         )
+    if queries:
+        # The tables are independent, so send all the updates in one round trip
+        logged_query(cr, sql.SQL(";").join(queries), query_args)
 
 
 def _change_reference_refs_orm(
-    env, model_name, record_ids, target_record_id, exclude_columns
+    env, model_name, record_ids, target_record_id, exclude_columns, fields=None
 ):
-    fields = env["ir.model.fields"].search([("ttype", "=", "reference")])
-    if version_info[0] >= 12:
-        fields |= env.ref("base.field_ir_property__value_reference")
-    else:
-        fields |= env.ref("base.field_ir_property_value_reference")
-    for field in fields:
-        try:
-            model = env[field.model].with_context(active_test=False)
-        except KeyError:
-            continue
-        field_name = field.name
-        if (
-            not model._auto
-            or not model._fields.get(field_name)
-            or not field.store
-            or (model._table, field_name) in exclude_columns
-        ):
-            continue  # Discard SQL views + invalid fields + non-stored fields
-        expr = ["%s,%s" % (model_name, x) for x in record_ids]
-        records = model.search([(field_name, "in", expr)])
-        if records:
-            records.write(
-                {
-                    field_name: "%s,%s" % (model_name, target_record_id),
-                }
-            )
+    if fields is None:
+        fields = _collect_relational_fields(env, model_name)["reference"]
+    targets = _get_fields_by_model(env, fields, exclude_columns)
+    expr = ["%s,%s" % (model_name, x) for x in record_ids]
+
+    def _is_merged(value):
+        # Reference fields read records, and ir.property's value_reference,
+        # strings
+        if value and not isinstance(value, str):
+            value = "%s,%s" % (value._name, value.id)
+        return value in expr
+
+    target_value = "%s,%s" % (model_name, target_record_id)
+    for field_model, (model, field_names) in targets.items():
+        records = _search_any(model, field_names, expr)
+        # Group the records by the fields to change, for writing them all at
+        # once instead of one write per field
+        groups = {}
+        for record in records:
+            changed_fields = tuple(f for f in field_names if _is_merged(record[f]))
+            if changed_fields:
+                groups.setdefault(changed_fields, []).append(record.id)
+        for changed_fields, ids in groups.items():
+            model.browse(ids).write(dict.fromkeys(changed_fields, target_value))
             logger.debug(
-                "Changed %s record(s) in reference field '%s' of model '%s'",
-                len(records),
-                field_name,
-                field.model,
+                "Changed %s record(s) in reference field(s) %s of model '%s'",
+                len(ids),
+                ", ".join("'%s'" % f for f in changed_fields),
+                field_model,
             )
 
 
@@ -288,47 +838,20 @@ def _change_translations_orm(
 ):
     if version_info[0] > 15:
         return
-    if ("ir_translation", "res_id") in exclude_columns:
-        return
-    translation_obj = env["ir.translation"]
-    groups = translation_obj.read_group(
-        [
-            ("type", "=", "model"),
-            ("res_id", "in", record_ids),
-            ("name", "like", "%s,%%" % model_name),
-        ],
-        ["name", "lang"],
-        ["name", "lang"],
-        lazy=False,
+    # Translations have no business logic attached, so the same set-based
+    # queries as the SQL method are used, instead of a search per group
+    _invalidate_cache(env)
+    _change_translations_sql(
+        env, model_name, record_ids, target_record_id, exclude_columns
     )
-    for group in groups:
-        target_translation = translation_obj.search(
-            [
-                ("type", "=", "model"),
-                ("res_id", "=", target_record_id),
-                ("name", "=", group["name"]),
-                ("lang", "=", group["lang"]),
-            ]
-        )
-        records = translation_obj.search(group["__domain"])
-        if not target_translation and records:
-            # There is no target translation, we pick one for being the new one
-            records[:1].res_id = target_record_id
-            records = records[1:]
-        if records:
-            records.unlink()
-            logger.debug(
-                "Deleted %s extra translations for %s (lang = %s).",
-                len(records),
-                group["name"],
-                group["lang"],
-            )
+    # Drop the translations (and translated values) loaded meanwhile
+    _invalidate_cache(env, flush=False)
 
 
 def _change_translations_sql(
     env, model_name, record_ids, target_record_id, exclude_columns
 ):
-    if version_info[0] > 15:
+    if version_info[0] > 15 or not record_ids:
         return
     if ("ir_translation", "res_id") in exclude_columns:
         return
@@ -386,6 +909,7 @@ def apply_operations_by_field_type(
     column,
     operation,
     method,
+    fast_update=False,
 ):
     vals = {}
     o2m_changes = 0
@@ -405,8 +929,7 @@ def apply_operations_by_field_type(
             if field_vals:
                 vals[column] = field_vals[0]
         elif operation == "merge":
-            _list = filter(lambda x: x, field_vals)
-            vals[column] = " | ".join(_list)
+            vals[column] = " | ".join(x for x in field_vals if x)
     elif field_type in ("jsonb", "serialized"):
         operation = operation or "first_not_null"
         if operation == "first_not_null":
@@ -448,12 +971,12 @@ def apply_operations_by_field_type(
             field_vals = [False if x is None else x for x in field_vals]
         operation = operation or "other"
         if operation == "and":
-            vals[column] = functools.reduce(lambda x, y: x & y, field_vals)
+            vals[column] = all(field_vals)
         elif operation == "or":
-            vals[column] = functools.reduce(lambda x, y: x | y, field_vals)
+            vals[column] = any(field_vals)
     elif field_type in ("date", "datetime"):
         if operation:
-            field_vals = list(filter(lambda x: x, field_vals))
+            field_vals = [x for x in field_vals if x]
         operation = field_vals and operation or "other"
         if operation == "max":
             vals[column] = max(field_vals)
@@ -466,13 +989,37 @@ def apply_operations_by_field_type(
     elif field_type == "many2many" and method == "orm":
         operation = operation or "merge"
         if operation == "merge":
-            field_vals = filter(lambda x: x is not False, field_vals)
-            vals[column] = [(4, x.id) for x in field_vals]
+            # Only link the records that the target doesn't have yet
+            new_vals = field_vals - first_value
+            if new_vals:
+                vals[column] = [(4, x.id) for x in new_vals]
     elif field_type == "one2many" and method == "orm":
         operation = operation or "merge"
         if operation == "merge":
             o2m_changes += 1
-            field_vals.write({field.inverse_name: target_record_id})
+            inverse = field_vals._fields[field.inverse_name]
+            if (
+                fast_update
+                and inverse.type == "many2one"
+                and inverse.store
+                and field_vals
+            ):
+                # Reassign the lines through SQL, skipping the write overhead
+                _flush_model(field_vals, [field.inverse_name])
+                if version_info[0] >= 14:
+                    field_vals.modified([field.inverse_name], before=True)
+                logged_query(
+                    env.cr,
+                    sql.SQL("UPDATE {table} SET {column} = %s WHERE id IN %s").format(
+                        table=sql.Identifier(field_vals._table),
+                        column=sql.Identifier(field.inverse_name),
+                    ),
+                    (target_record_id, tuple(field_vals.ids)),
+                )
+                _invalidate_cache(env)
+                field_vals.modified([field.inverse_name])
+            else:
+                field_vals.write({field.inverse_name: target_record_id})
     elif field_type == "binary":
         operation = operation or "merge"
         if operation == "merge":
@@ -514,8 +1061,181 @@ def apply_operations_by_field_type(
         return vals
 
 
+def _flush_model(model, fnames):
+    """Flush pending ORM updates of the given fields before reading or
+    writing them through SQL."""
+    if version_info[0] > 15:
+        model.flush_model(fnames)
+    elif version_info[0] >= 13:
+        model.flush(fnames)
+
+
+# SQL aggregates equivalent to the operations that only reduce the values of
+# a field in apply_operations_by_field_type, indexed by (field type, operation)
+_SQL_MERGE_AGGREGATE = (
+    "STRING_AGG(NULLIF({column}, ''), ' | ' "
+    "ORDER BY ARRAY_POSITION(%(ordered_ids)s, id))"
+)
+_SQL_AGGREGATES = {
+    ("integer", "sum"): "COALESCE(SUM({column}), 0)",
+    ("integer", "avg"): "AVG(COALESCE({column}, 0))",
+    ("integer", "max"): "MAX(COALESCE({column}, 0))",
+    ("integer", "min"): "MIN(COALESCE({column}, 0))",
+    ("float", "sum"): "COALESCE(SUM({column}), 0)",
+    ("float", "avg"): "AVG(COALESCE({column}, 0))",
+    ("float", "max"): "MAX(COALESCE({column}, 0))",
+    ("float", "min"): "MIN(COALESCE({column}, 0))",
+    ("monetary", "sum"): "COALESCE(SUM({column}), 0)",
+    ("monetary", "avg"): "AVG(COALESCE({column}, 0))",
+    ("monetary", "max"): "MAX(COALESCE({column}, 0))",
+    ("monetary", "min"): "MIN(COALESCE({column}, 0))",
+    ("boolean", "and"): "BOOL_AND(COALESCE({column}, FALSE))",
+    ("boolean", "or"): "BOOL_OR(COALESCE({column}, FALSE))",
+    ("date", "max"): "MAX({column})",
+    ("date", "min"): "MIN({column})",
+    ("datetime", "max"): "MAX({column})",
+    ("datetime", "min"): "MIN({column})",
+    ("char", "merge"): _SQL_MERGE_AGGREGATE,
+    ("text", "merge"): _SQL_MERGE_AGGREGATE,
+    ("html", "merge"): _SQL_MERGE_AGGREGATE,
+}
+
+
+def _get_sql_aggregated_values(env, model, record_ids, fields, field_spec):
+    """Compute in a single query the values of the fields whose merge
+    operation is a plain aggregation of the values of all the records.
+
+    :param record_ids: ids of the target record + the records to merge, in
+      the order their values are concatenated by the 'merge' operation.
+
+    :return: dictionary with field names as keys and the aggregated values.
+    """
+    aggregates = {}
+    for field in fields:
+        op = field_spec.get(field.name) or {
+            "float": "sum",
+            "monetary": "sum",
+            "text": "merge",
+            "html": "merge",
+        }.get(field.type, False)
+        if getattr(field, "company_dependent", False):
+            continue  # stored as jsonb since v18
+        if getattr(field, "translate", False):
+            continue  # translated values aren't in the column
+        if (field.type, op) in _SQL_AGGREGATES:
+            aggregates[field.name] = _SQL_AGGREGATES[(field.type, op)]
+    if not aggregates:
+        return {}
+    _flush_model(model, list(aggregates))
+    env.cr.execute(
+        sql.SQL("SELECT {aggregates} FROM {table} WHERE id IN %(ids)s").format(
+            aggregates=sql.SQL(", ").join(
+                sql.SQL(expression).format(column=sql.Identifier(name))
+                for name, expression in aggregates.items()
+            ),
+            table=sql.Identifier(model._table),
+        ),
+        {"ids": tuple(record_ids), "ordered_ids": list(record_ids)},
+    )
+    result = {}
+    for name, value in zip(aggregates, env.cr.fetchone()):
+        if model._fields[name].type in ("float", "monetary") or (
+            model._fields[name].type == "integer" and field_spec[name] == "avg"
+        ):
+            # Postgres returns numeric aggregates as Decimal
+            value = float(value) if value is not None else None
+        result[name] = value
+    return result
+
+
+# Field types whose merged value can be written directly on their column
+_SQL_WRITABLE_FIELD_TYPES = {
+    "boolean",
+    "char",
+    "date",
+    "datetime",
+    "float",
+    "html",
+    "integer",
+    "many2one",
+    "many2one_reference",
+    "monetary",
+    "selection",
+    "text",
+}
+
+
+def _get_changed_values(record, vals):
+    """Keep only the values to write that differ from the current ones of the
+    record, comparing relational fields by their ids."""
+    changed = {}
+    for name, value in vals.items():
+        field = record._fields[name]
+        current = record[name]
+        if field.type == "many2many":
+            if any(command[1] not in current.ids for command in value):
+                changed[name] = value
+        elif field.type == "many2one":
+            if value != current.id:
+                changed[name] = value
+        elif value != current:
+            changed[name] = value
+    return changed
+
+
+# Default merge operation and operations that change the target record value,
+# by field type, as applied by apply_operations_by_field_type
+_MERGE_OPERATIONS = {
+    "char": (False, {"first_not_null", "merge"}),
+    "text": ("merge", {"first_not_null", "merge"}),
+    "html": ("merge", {"first_not_null", "merge"}),
+    "jsonb": ("first_not_null", {"first_not_null"}),
+    "serialized": ("first_not_null", {"first_not_null"}),
+    "integer": (False, {"sum", "avg", "max", "min", "first_not_null"}),
+    "float": ("sum", {"sum", "avg", "max", "min", "first_not_null"}),
+    "monetary": ("sum", {"sum", "avg", "max", "min", "first_not_null"}),
+    "boolean": (False, {"and", "or"}),
+    "date": (False, {"max", "min", "first_not_null"}),
+    "datetime": (False, {"max", "min", "first_not_null"}),
+    "many2many": ("merge", {"merge"}),
+    "one2many": ("merge", {"merge"}),
+    "binary": ("merge", {"merge"}),
+    "many2one": ("merge", {"merge"}),
+    "reference": ("merge", {"merge"}),
+    "many2one_reference": ("merge", {"merge"}),
+    "selection": (False, {"first_not_null"}),
+}
+
+
+# Fields filled by the ORM itself, whose values aren't merged by default
+_LOG_ACCESS_FIELDS = {
+    "id",
+    "create_uid",
+    "create_date",
+    "write_uid",
+    "write_date",
+    "__last_update",
+}
+
+
+def _get_merge_operation(field, field_spec):
+    """Resolve the type and operation used for merging the field values.
+
+    :return: tuple with the field type and the operation, or None if the
+      operation keeps the target record value, so there's nothing to do.
+    """
+    field_type = field.type
+    if version_info[0] > 15 and field.translate:
+        field_type = "jsonb"
+    default, operations = _MERGE_OPERATIONS.get(field_type, (False, ()))
+    op = field_spec.get(field.name, False)
+    if (op or default) not in operations:
+        return None
+    return field_type, op
+
+
 def _adjust_merged_values_orm(
-    env, model_name, record_ids, target_record_id, field_spec
+    env, model_name, record_ids, target_record_id, field_spec, fast_update=False
 ):
     """This method deals with the values on the records to be merged +
     the target record, performing operations that make sense on the meaning
@@ -526,6 +1246,8 @@ def _adjust_merged_values_orm(
       operation will be performed.
       Note: If you pass 'openupgrade_other_fields': 'preserve' in the dict,
       the fields that are not specified in the dict will not be adjusted.
+      Log access fields (create_uid, create_date, write_uid, write_date) are
+      only adjusted when they are specified in the dict.
 
       Possible operations by field types:
 
@@ -586,21 +1308,51 @@ def _adjust_merged_values_orm(
         - 'first_not_null' (default): For each found key, put first not null value.
         - other value: content on target record is preserved
     """
+    record_ids = tuple(x for x in record_ids if x and x != target_record_id)
+    if not record_ids:
+        return
     model = env[model_name]
-    fields = model._fields.values()
+    fields = [
+        field
+        for field in model._fields.values()
+        if (
+            field_spec.get("openupgrade_other_fields", "") != "preserve"
+            or field.name in field_spec
+        )
+        # don't do anything on these cases
+        and field.store
+        and not field.compute
+        and not field.related
+        # nor on the log access fields, unless explicitly asked
+        and (field.name not in _LOG_ACCESS_FIELDS or field.name in field_spec)
+        # nor on the ones whose operation preserves the target value
+        and _get_merge_operation(field, field_spec)
+    ]
     all_records = model.browse((target_record_id,) + tuple(record_ids))
     target_record = model.browse(target_record_id)
     vals = {}
     o2m_changes = 0
+    # Reduce in the database the values of fields that only need it
+    aggregated_vals = _get_sql_aggregated_values(
+        env, model, all_records.ids, fields, field_spec
+    )
+    for name, value in aggregated_vals.items():
+        if value is not None:
+            vals[name] = value
+    # Load in one query the values of the rest of fields into the cache
+    fnames = [f.name for f in fields if f.name not in aggregated_vals]
+    if fnames:
+        if hasattr(all_records, "fetch"):
+            all_records.fetch(fnames)
+        else:
+            all_records.read(fnames)
     for field in fields:
-        if (
-            field_spec.get("openupgrade_other_fields", "") == "preserve"
-            and field.name not in field_spec
-        ):
+        if field.name in aggregated_vals:
             continue
-        if not field.store or field.compute or field.related:
-            continue  # don't do anything on these cases
-        op = field_spec.get(field.name, False)
+        operation = _get_merge_operation(field, field_spec)
+        if not operation:
+            continue  # spec changed by a previous many2one_reference merge
+        field_type, op = operation
         if field.type != "reference":
             _list = all_records.mapped(field.name)
         else:
@@ -612,29 +1364,66 @@ def _adjust_merged_values_orm(
             target_record_id,
             field_spec,
             _list,
-            field.type if not (version_info[0] > 15 and field.translate) else "jsonb",
+            field_type,
             field.name,
             op,
             "orm",
+            fast_update=fast_update,
         )
         vals.update(field_vals)
         o2m_changes += field_o2m_changes
     if not vals:
         return
+    column_vals = {}
+    if fast_update:
+        # Write plain column values through SQL, letting the database skip the
+        # write when none of them has changed
+        for f in list(vals):
+            field = model._fields[f]
+            if (
+                field.type in _SQL_WRITABLE_FIELD_TYPES
+                and not getattr(field, "translate", False)
+                and not getattr(field, "company_dependent", False)
+            ):
+                value = vals.pop(f)
+                if hasattr(field, "convert_to_column"):
+                    value = field.convert_to_column(value, target_record)
+                elif value is False and field.type != "boolean":
+                    value = None
+                column_vals[f] = value
+    written = 0
+    if column_vals:
+        _flush_model(model, list(column_vals))
+        env.cr.execute(
+            sql.SQL(
+                "UPDATE {table} SET {assignments} WHERE id = %s AND ({changed})"
+            ).format(
+                table=sql.Identifier(model._table),
+                assignments=sql.SQL(", ").join(
+                    sql.SQL("{} = %s").format(sql.Identifier(f)) for f in column_vals
+                ),
+                changed=sql.SQL(" OR ").join(
+                    sql.SQL("{} IS DISTINCT FROM %s").format(sql.Identifier(f))
+                    for f in column_vals
+                ),
+            ),
+            tuple(column_vals.values())
+            + (target_record_id,)
+            + tuple(column_vals.values()),
+        )
+        if env.cr.rowcount:
+            written = len(column_vals)
+            _invalidate_cache(env, flush=False)
+            target_record.modified(list(column_vals))
     # Curate values that haven't changed
-    new_vals = {}
-    for f in vals:
-        if model._fields[f].type != "many2many":
-            if vals[f] != getattr(target_record, f):
-                new_vals[f] = vals[f]
-        else:
-            if [x[1] for x in vals[f]] not in getattr(target_record, f).ids:
-                new_vals[f] = vals[f]
-    if new_vals:
-        target_record.write(new_vals)
+    vals = _get_changed_values(target_record, vals)
+    if vals:
+        target_record.write(vals)
+        written += len(vals)
+    if written:
         logger.debug(
             "Write %s value(s) in target record '%s' of model '%s'",
-            len(new_vals) + o2m_changes,
+            written + o2m_changes,
             target_record_id,
             model_name,
         )
@@ -766,6 +1555,16 @@ def _change_generic(
       feature, for example when replacing one model per another (i.e.:
       account.invoice > account.move).
     """
+    if not record_ids:
+        return
+    # Tables to be changed through SQL
+    candidates = []
+    query_args = {
+        "model_name": model_name,
+        "new_model_name": new_model_name or model_name,
+        "target_record_id": target_record_id,
+        "record_ids": tuple(record_ids),
+    }
     for model_to_replace, res_id_column, model_column in [
         ("calendar.event", "res_id", "res_model"),
         ("ir.attachment", "res_id", "res_model"),
@@ -775,7 +1574,9 @@ def _change_generic(
         ("rating.rating", "res_id", "res_model"),
     ]:
         try:
-            model = env[model_to_replace].with_context(active_test=False)
+            model = env[model_to_replace].with_context(
+                active_test=False, prefetch_fields=False
+            )
             table = model._table
         except KeyError:
             if method == "orm":
@@ -816,98 +1617,158 @@ def _change_generic(
                     "Changed %s record(s) of model '%s'", len(records), model_to_replace
                 )
         else:
-            if not column_exists(env.cr, table, res_id_column) or not column_exists(
-                env.cr, table, model_column
-            ):
-                continue
-            format_args = {
-                "table": sql.Identifier(table),
-                "res_id_column": sql.Identifier(res_id_column),
-                "model_column": sql.Identifier(model_column),
-            }
-            query_args = {
-                "model_name": model_name,
-                "new_model_name": new_model_name or model_name,
-                "target_record_id": target_record_id,
-                "record_ids": tuple(record_ids),
-            }
-            query = sql.SQL(
-                "UPDATE {table} SET {res_id_column} = %(target_record_id)s"
-            ).format(**format_args)
-            if new_model_name:
-                query += sql.SQL(", {model_column} = %(new_model_name)s").format(
-                    **format_args
-                )
-            query += sql.SQL(" WHERE {model_column} = %(model_name)s ").format(
+            candidates.append((model_to_replace, table, res_id_column, model_column))
+    if not candidates:
+        return
+    # Get the columns of all the tables in one query instead of probing them
+    env.cr.execute(
+        """SELECT cl.relname::text, att.attname::text
+        FROM pg_attribute att
+        JOIN pg_class cl ON cl.oid = att.attrelid
+        WHERE cl.relname = ANY(%s) AND att.attnum > 0 AND NOT att.attisdropped
+        """,
+        ([x[1] for x in candidates],),
+    )
+    existing_columns = set(env.cr.fetchall())
+    candidates = [
+        x
+        for x in candidates
+        if (x[1], x[2]) in existing_columns and (x[1], x[3]) in existing_columns
+    ]
+    if not candidates:
+        return
+    if len(record_ids) >= _STAGE_IDS_THRESHOLD:
+        query_args["record_ids"] = _stage_ids(env.cr, record_ids)
+    # Find in one query which tables have references to change
+    env.cr.execute(
+        sql.SQL(" UNION ALL ").join(
+            sql.SQL(
+                "SELECT {index} WHERE EXISTS (SELECT 1 FROM {table} "
+                "WHERE {model_column} = %(model_name)s "
+                "AND {res_id_column} IN %(record_ids)s)"
+            ).format(
+                index=sql.Literal(index),
+                table=sql.Identifier(table),
+                res_id_column=sql.Identifier(res_id_column),
+                model_column=sql.Identifier(model_column),
+            )
+            for index, (_, table, res_id_column, model_column) in enumerate(
+                candidates
+            )
+        ),
+        query_args,
+    )
+    candidates = [candidates[row[0]] for row in sorted(env.cr.fetchall())]
+    queries = []
+    for model_to_replace, table, res_id_column, model_column in candidates:
+        format_args = {
+            "table": sql.Identifier(table),
+            "res_id_column": sql.Identifier(res_id_column),
+            "model_column": sql.Identifier(model_column),
+        }
+        query = sql.SQL(
+            "UPDATE {table} SET {res_id_column} = %(target_record_id)s"
+        ).format(**format_args)
+        if new_model_name:
+            query += sql.SQL(", {model_column} = %(new_model_name)s").format(
                 **format_args
             )
-            if model_to_replace != "mail.followers":
-                query += sql.SQL("AND {res_id_column} in %(record_ids)s").format(
-                    **format_args
+        if model_to_replace != "mail.followers":
+            query += sql.SQL(
+                " WHERE {model_column} = %(model_name)s "
+                "AND {res_id_column} in %(record_ids)s"
+            ).format(**format_args)
+            queries.append(query)
+            continue
+        # Move one follower per follower identity not already following the
+        # target record, and remove the rest (that are duplicates)
+        follower_columns = ["partner_id"]
+        if (table, "channel_id") in existing_columns:
+            follower_columns.append("channel_id")
+        format_args.update(
+            follower_columns=sql.SQL(", ").join(
+                map(sql.Identifier, follower_columns)
+            ),
+            same_follower=sql.SQL(" AND ").join(
+                sql.SQL("f2.{col} IS NOT DISTINCT FROM f.{col}").format(
+                    col=sql.Identifier(col)
                 )
-                logged_query(env.cr, query, query_args, skip_no_result=True)
-            else:
-                for record_id in record_ids:
-                    query_args["record_id"] = record_id
-                    query2 = (
-                        query
-                        + sql.SQL(
-                            """AND {res_id_column} = %(record_id)s
-                        AND partner_id NOT IN (
-                            SELECT partner_id FROM {table}
-                            WHERE {res_id_column} = %(target_record_id)s
-                                AND {model_column} = %(new_model_name)s
-                        )"""
-                        ).format(**format_args)
-                    )
-                    logged_query(
-                        env.cr,
-                        query2,
-                        query_args,
-                        skip_no_result=True,
+                for col in follower_columns
+            ),
+        )
+        queries.append(
+            sql.SQL(
+                """WITH moved AS ({query} WHERE id IN (
+                    SELECT DISTINCT ON ({follower_columns}) f.id
+                    FROM {table} f
+                    WHERE f.{model_column} = %(model_name)s
+                    AND f.{res_id_column} IN %(record_ids)s
+                    AND NOT EXISTS (
+                        SELECT 1 FROM {table} f2
+                        WHERE f2.{res_id_column} = %(target_record_id)s
+                        AND f2.{model_column} = %(new_model_name)s
+                        AND {same_follower}
                     )
-                # Remove remaining records non updated (that are duplicates)
-                logged_query(
-                    env.cr,
-                    sql.SQL(
-                        "DELETE FROM {table} "
-                        "WHERE {model_column} = %(model_name)s "
-                        "AND {res_id_column} IN %(record_ids)s"
-                    ).format(**format_args),
-                    query_args,
-                    skip_no_result=True,
-                )
+                    ORDER BY {follower_columns}, f.id
+                ) RETURNING id)
+                DELETE FROM {table}
+                WHERE {model_column} = %(model_name)s
+                AND {res_id_column} IN %(record_ids)s
+                AND id NOT IN (SELECT id FROM moved)"""
+            ).format(query=query, **format_args)
+        )
+    if queries:
+        logged_query(env.cr, sql.SQL(";\n").join(queries), query_args)
 
 
 def _delete_records_sql(
     env, model_name, record_ids, target_record_id, model_table=None
 ):
+    if not record_ids:
+        return
     if not model_table:
         try:
             model_table = env[model_name]._table
         except KeyError:
             model_table = get_model2table(model_name)
+    # Linked records are matched by model name and res_id, which are served
+    # by the (model, res_id) and (res_model, res_id) indexes of these tables
     logged_query(
         env.cr,
-        "DELETE FROM ir_model_data WHERE model = %s AND res_id IN %s",
-        (model_name, tuple(record_ids)),
-    )
-    logged_query(
-        env.cr,
-        "DELETE FROM ir_attachment WHERE res_model = %s AND res_id IN %s",
-        (model_name, tuple(record_ids)),
-    )
-    logged_query(
-        env.cr,
-        sql.SQL("DELETE FROM {} WHERE id IN %s").format(sql.Identifier(model_table)),
-        (tuple(record_ids),),
+        sql.SQL(
+            """
+            WITH deleted_xmlids AS (
+                DELETE FROM ir_model_data
+                WHERE model = %(model_name)s AND res_id IN %(record_ids)s
+            ), deleted_attachments AS (
+                DELETE FROM ir_attachment
+                WHERE res_model = %(model_name)s AND res_id IN %(record_ids)s
+            )
+            DELETE FROM {table} WHERE id IN %(record_ids)s"""
+        ).format(table=sql.Identifier(model_table)),
+        {
+            "model_name": model_name,
+            "record_ids": (
+                _stage_ids(env.cr, record_ids)
+                if len(record_ids) >= _STAGE_IDS_THRESHOLD
+                else tuple(record_ids)
+            ),
+        },
     )
 
 
-def _delete_records_orm(env, model_name, record_ids, target_record_id):
+def _delete_records_orm(
+    env, model_name, record_ids, target_record_id, fast_delete=False
+):
     records = env[model_name].browse(record_ids).exists()
     if records:
-        records.unlink()
+        if fast_delete:
+            # References have already been moved to the target record, so
+            # there's no need to go through unlink machinery
+            _invalidate_cache(env)
+            _delete_records_sql(env, model_name, records.ids, target_record_id)
+        else:
+            records.unlink()
         logger.debug(
             "Deleted %s source record(s) of model '%s'",
             len(record_ids),
@@ -923,22 +1784,22 @@ def _check_recurrence(env, model_name, record_ids, target_record_id, model_table
             model_table = get_model2table(model_name)
     env.cr.execute(
         """
-        SELECT tc.table_name, kcu.column_name, COALESCE(imf.column1, 'id')
-        FROM information_schema.table_constraints AS tc
-        JOIN information_schema.key_column_usage AS kcu
-            ON tc.constraint_name = kcu.constraint_name
-            AND tc.table_schema = kcu.table_schema
-        JOIN information_schema.constraint_column_usage AS ccu
-            ON ccu.constraint_name = tc.constraint_name
-            AND ccu.table_schema = tc.table_schema
+        SELECT cl.relname, att.attname, COALESCE(imf.column1, 'id')
+        FROM pg_constraint con
+        JOIN pg_class cl ON cl.oid = con.conrelid
+        JOIN pg_class ref ON ref.oid = con.confrelid
+        JOIN pg_attribute att
+            ON att.attrelid = con.conrelid AND att.attnum = con.conkey[1]
+        JOIN pg_attribute ref_att
+            ON ref_att.attrelid = con.confrelid AND ref_att.attnum = con.confkey[1]
         JOIN ir_model_fields AS imf
             ON imf.model = %s AND imf.relation = imf.model AND ((
-                imf.name = kcu.column_name AND
-                tc.table_name = ccu.table_name) OR (
-                imf.column2 = kcu.column_name AND
-                tc.table_name = imf.relation_table))
-        WHERE tc.constraint_type = 'FOREIGN KEY'
-        AND ccu.table_name = %s and ccu.column_name = 'id'
+                imf.name = att.attname AND
+                cl.relname = ref.relname) OR (
+                imf.column2 = att.attname AND
+                cl.relname = imf.relation_table))
+        WHERE con.contype = 'f'
+        AND ref.relname = %s AND ref_att.attname = 'id'
         """,
         (model_name, model_table),
     )
@@ -976,6 +1837,66 @@ def _check_recurrence(env, model_name, record_ids, target_record_id, model_table
     return False
 
 
+def _restore_foreign_keys(cr, constraints):
+    """Check the deferred foreign keys and make them not deferrable again."""
+    # Check now the pending references, before restoring the constraints
+    cr.execute(
+        sql.SQL("SET CONSTRAINTS {} IMMEDIATE").format(
+            sql.SQL(", ").join(sql.Identifier(name) for _, name in constraints)
+        )
+    )
+    for table, name in constraints:
+        cr.execute(
+            sql.SQL("ALTER TABLE {} ALTER CONSTRAINT {} NOT DEFERRABLE").format(
+                sql.Identifier(table), sql.Identifier(name)
+            )
+        )
+
+
+@contextmanager
+def _deferred_foreign_keys(cr, model_table, active=True):
+    """Make deferrable the foreign keys pointing to the given table, and defer
+    their checks until the end of the block, when they are restored.
+
+    The block runs under a savepoint, so the constraints are restored even
+    when it fails leaving the transaction aborted."""
+    constraints = []
+    if active:
+        cr.execute(
+            """SELECT cl.relname, con.conname
+            FROM pg_constraint con
+            JOIN pg_class cl ON cl.oid = con.conrelid
+            WHERE con.contype = 'f' AND NOT con.condeferrable
+            AND con.confrelid = to_regclass(quote_ident(%s))""",
+            (model_table,),
+        )
+        constraints = cr.fetchall()
+    if not constraints:
+        yield
+        return
+    for table, name in constraints:
+        cr.execute(
+            sql.SQL("ALTER TABLE {} ALTER CONSTRAINT {} DEFERRABLE").format(
+                sql.Identifier(table), sql.Identifier(name)
+            )
+        )
+    cr.execute(
+        sql.SQL("SET CONSTRAINTS {} DEFERRED").format(
+            sql.SQL(", ").join(sql.Identifier(name) for _, name in constraints)
+        )
+    )
+    cr.execute("SAVEPOINT deferred_foreign_keys")
+    try:
+        yield
+    except Exception:
+        # Leave the transaction usable for restoring the constraints
+        cr.execute("ROLLBACK TO SAVEPOINT deferred_foreign_keys")
+        raise
+    finally:
+        cr.execute("RELEASE SAVEPOINT deferred_foreign_keys")
+        _restore_foreign_keys(cr, constraints)
+
+
 def merge_records(
     env,
     model_name,
@@ -986,6 +1907,9 @@ def merge_records(
     delete=True,
     exclude_columns=None,
     model_table=None,
+    fast_update=False,
+    fast_delete=False,
+    defer_foreign_keys=False,
 ):
     """Merge several records into the target one.
 
@@ -1004,47 +1928,41 @@ def merge_records(
     :param method: Specify how to perform operations. By default or specifying
       'orm', operations will be performed with ORM, maybe slower, but safer, as
       related and computed fields will be recomputed on changes, and all
-      constraints will be checked.
+      constraints will be checked (unless `fast_update` is set).
     :param delete: If set, the source ids will be unlinked.
     :exclude_columns: list of tuples (table, column) that will be ignored.
     :model_table: name of the model table. If not provided, got through ORM.
+    :fast_update: only for 'orm' method. If set, the many2one references, the
+      many2many relations, the lines of the merged one2many fields and the
+      plain column values of the target record are changed through SQL,
+      notifying the ORM afterwards only for recomputing the fields depending
+      on them. This skips the constraints in Python, the write overrides,
+      the tracking and the update of the log access fields.
+    :fast_delete: only for 'orm' method. If set, the source records are
+      deleted through SQL instead of being unlinked, skipping the ORM
+      unlink overrides and ondelete handling.
+    :defer_foreign_keys: only for 'sql' method. If set, the foreign keys
+      pointing to the model table are made deferrable during the merge, and
+      their checks are postponed until the end of it. The checks are only
+      moved, not reduced: every changed row is still checked. Altering the
+      constraints takes ACCESS EXCLUSIVE locks on the referencing tables,
+      held until the end of the transaction, so any concurrent access to
+      them is blocked meanwhile.
     """
-    if exclude_columns is None:
-        exclude_columns = []
+    exclude_columns = frozenset(tuple(x) for x in exclude_columns or ())
     if field_spec is None and method == "orm":
         field_spec = {}
-    if isinstance(record_ids, list):
-        record_ids = tuple(record_ids)
-    args0 = (env, model_name, record_ids, target_record_id)
-    args = args0 + (exclude_columns,)
+    record_ids = tuple(record_ids)
+    if not record_ids:
+        return
     if target_record_id in record_ids:
         raise Exception(
             "You can't put the target record in the list or records to be merged."
         )
-    _change_generic(*args, method=method)  # pylint: disable=E1124
+    # Check which records to be merged exist, before doing any work
     if method == "orm":
-        # Check which records to be merged exist
-        record_ids = env[model_name].browse(record_ids).exists().ids
-        if not record_ids:
-            return
-        if _check_recurrence(env, model_name, record_ids, target_record_id):
-            return
-        _change_many2one_refs_orm(*args)
-        _change_many2many_refs_orm(*args)
-        _change_reference_refs_orm(*args)
-        _change_translations_orm(*args)
-        args2 = args0 + (field_spec,)
-        # TODO: serialized fields
-        with env.norecompute():
-            _adjust_merged_values_orm(*args2)
-        if version_info[0] > 15:
-            env[model_name].flush_model()
-        else:
-            env[model_name].recompute()
-        if delete:
-            _delete_records_orm(env, model_name, record_ids, target_record_id)
+        record_ids = tuple(env[model_name].browse(record_ids).exists().ids)
     else:
-        # Check which records to be merged exist
         if not model_table:
             try:
                 model_table = env[model_name]._table
@@ -1054,23 +1972,73 @@ def merge_records(
             sql.SQL("SELECT id FROM {} WHERE id IN %s").format(
                 sql.Identifier(model_table)
             ),
-            (tuple(record_ids),),
+            (record_ids,),
         )
-        record_ids = [x[0] for x in env.cr.fetchall()]
-        if not record_ids:
-            return
-        if _check_recurrence(
-            env, model_name, record_ids, target_record_id, model_table=model_table
-        ):
-            return
-        args3 = args + (model_table,)
-        _change_foreign_key_refs(*args3)
-        _change_reference_refs_sql(*args)
-        _change_translations_sql(*args)
-        if field_spec is not None:
-            args4 = args0 + (model_table,) + (field_spec,)
-            _adjust_merged_values_sql(*args4)
+        record_ids = tuple(x[0] for x in env.cr.fetchall())
+    if not record_ids:
+        return
+    if _check_recurrence(
+        env, model_name, record_ids, target_record_id, model_table=model_table
+    ):
+        return
+    args0 = (env, model_name, record_ids, target_record_id)
+    args = args0 + (exclude_columns,)
+    _change_generic(*args, method=method)  # pylint: disable=E1124
+    if method == "orm":
+        fields = _collect_relational_fields(env, model_name)
+        _change_many2one_refs_orm(
+            *args, fields=fields["many2one"], fast_update=fast_update
+        )
+        _change_many2many_refs_orm(
+            *args, fields=fields["many2many"], fast_update=fast_update
+        )
+        _change_reference_refs_orm(*args, fields=fields["reference"])
+        _change_translations_orm(*args)
+        args2 = args0 + (field_spec,)
+        # TODO: serialized fields
+        with env.norecompute():
+            _adjust_merged_values_orm(*args2, fast_update=fast_update)
+        if version_info[0] > 15:
+            env[model_name].flush_model()
+        else:
+            env[model_name].recompute()
         if delete:
-            _delete_records_sql(
-                env, model_name, record_ids, target_record_id, model_table=model_table
+            _delete_records_orm(
+                env,
+                model_name,
+                record_ids,
+                target_record_id,
+                fast_delete=fast_delete,
             )
+    else:
+        # Discover the foreign keys and reference columns once for the whole
+        # merge
+        foreign_key_refs = _get_foreign_key_refs(env.cr, model_table)
+        reference_columns = _get_reference_columns(env, exclude_columns)
+        # Bound the size of the statements for big merges
+        batches = [
+            record_ids[i : i + _MERGE_BATCH_SIZE]
+            for i in range(0, len(record_ids), _MERGE_BATCH_SIZE)
+        ]
+        with _deferred_foreign_keys(env.cr, model_table, defer_foreign_keys):
+            for batch in batches:
+                batch_args = (env, model_name, batch, target_record_id, exclude_columns)
+                _change_foreign_key_refs(
+                    *batch_args + (model_table,), foreign_key_refs=foreign_key_refs
+                )
+                _change_reference_refs_sql(
+                    *batch_args, columns_by_table=reference_columns
+                )
+                _change_translations_sql(*batch_args)
+            if field_spec is not None:
+                args4 = args0 + (model_table,) + (field_spec,)
+                _adjust_merged_values_sql(*args4)
+            if delete:
+                for batch in batches:
+                    _delete_records_sql(
+                        env,
+                        model_name,
+                        batch,
+                        target_record_id,
+                        model_table=model_table,
+                    )
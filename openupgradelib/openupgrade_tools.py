@@ -22,12 +22,18 @@
 # A collection of functions split off from openupgrade.py
 # with no or only minimal dependencies
 import logging
+import threading
 
-from lxml.etree import tostring
+from lxml.cssselect import CSSSelector
+from lxml.etree import XPath, tostring
 from lxml.html import fromstring
 
 logger = logging.getLogger(__name__)
 
+# Compiled selectors used by convert_html_fragment, indexed by (mode, selector).
+# They are kept per thread, as compiled XPath expressions are not thread-safe.
+_compiled_selectors = threading.local()
+
 
 def table_exists(cr, table):
     """Check whether a certain table or view exists"""
@@ -47,6 +53,34 @@ def column_exists(cr, table, column):
     return cr.fetchone()[0] == 1
 
 
+def _get_compiled_selector(selector, mode="css"):
+    """Get a compiled version of the given selector.
+
+    Translating a CSS selector to XPath and compiling it is much more
+    expensive than evaluating it, so compile each selector only once.
+
+    :param str selector:
+        CSS or XPath expression.
+
+    :param str mode:
+        ``css`` or ``xpath``.
+
+    :return callable:
+        Callable that receives an element and returns the matching nodes.
+    """
+    cache = getattr(_compiled_selectors, "cache", None)
+    if cache is None:
+        cache = _compiled_selectors.cache = {}
+    key = (mode, selector)
+    if key not in cache:
+        if mode == "css":
+            # Same translator that HtmlElement.cssselect uses
+            cache[key] = CSSSelector(selector, translator="html")
+        else:
+            cache[key] = XPath(selector)
+    return cache[key]
+
+
 def convert_html_fragment(html_string, replacements, pretty_print=True):
     """Get a string that contains XML and apply replacements to it.
 
@@ -97,17 +131,33 @@ def convert_html_fragment(html_string, replacements, pretty_print=True):
     parsed_html_string = tostring(
         fragment, pretty_print=pretty_print, encoding="unicode"
     )
+    # Classes used in the fragment, for discarding class replacements without
+    # evaluating their selector. Recomputed after any node is converted.
+    classes = None
     for spec in replacements:
         instructions = spec.copy()
         # Find matching nodes
         selector = instructions.pop("selector")
         mode = instructions.pop("selector_mode", "css")
         assert mode in {"css", "xpath"}
-        finder = fragment.cssselect if mode == "css" else fragment.xpath
-        nodes = finder(selector)
+        class_rm = instructions.get("class_rm")
+        if (
+            mode == "css"
+            and isinstance(class_rm, str)
+            and selector == ".%s" % ".".join(class_rm.split())
+        ):
+            if classes is None:
+                classes = {
+                    cls for value in fragment.xpath("//@class") for cls in value.split()
+                }
+            if not classes.issuperset(class_rm.split()):
+                continue
+        nodes = _get_compiled_selector(selector, mode)(fragment)
         # Apply node conversions as instructed
         for node in nodes:
             convert_xml_node(node, **instructions)
+        if nodes:
+            classes = None
     # So if there were no replacement we just return the original string as it was
     new_html_string = tostring(fragment, pretty_print=pretty_print, encoding="unicode")
     if new_html_string == parsed_html_string:
@@ -203,29 +253,48 @@ def convert_xml_node(
     style_add = style_add or {}
     # Obtain attributes, classes and styles
     classes = set(node.attrib.get("class", "").split())
-    styles = node.attrib.get("style", "").split(";")
-    styles = {
-        key.strip(): val.strip()
-        for key, val in (style.split(":", 1) for style in styles if ":" in style)
-    }
+    params = (
+        attr_add,
+        attr_rm,
+        attr_rp,
+        class_rp_by_inline,
+        class_add,
+        class_rm,
+        style_add,
+        style_rm,
+        tag,
+        wrap,
+    )
+    has_callables = any(callable(param) for param in params)
+    # Most conversions only touch classes or attributes, so styles are only
+    # parsed when they are really needed
+    if has_callables or style_add or style_rm:
+        styles = node.attrib.get("style", "").split(";")
+        styles = {
+            key.strip(): val.strip()
+            for key, val in (style.split(":", 1) for style in styles if ":" in style)
+        }
     # Convert incoming callable arguments into values
-    originals = {
-        "attrs": dict(node.attrib.items()),
-        "classes": classes.copy(),
-        "styles": styles.copy(),
-        "tag": node.tag,
-    }
-    _call = lambda v: v(**originals) if callable(v) else v  # noqa: E731
-    attr_add = _call(attr_add)
-    attr_rm = _call(attr_rm)
-    attr_rp = _call(attr_rp)
-    class_rp_by_inline = _call(class_rp_by_inline)
-    class_add = _call(class_add)
-    class_rm = _call(class_rm)
-    style_add = _call(style_add)
-    style_rm = _call(style_rm)
-    tag = _call(tag)
-    wrap = _call(wrap)
+    if has_callables:
+        originals = {
+            "attrs": dict(node.attrib.items()),
+            "classes": classes.copy(),
+            "styles": styles.copy(),
+            "tag": node.tag,
+        }
+        _call = lambda v: v(**originals) if callable(v) else v  # noqa: E731
+        (
+            attr_add,
+            attr_rm,
+            attr_rp,
+            class_rp_by_inline,
+            class_add,
+            class_rm,
+            style_add,
+            style_rm,
+            tag,
+            wrap,
+        ) = map(_call, params)
     # Patch node attributes
     if attr_add or attr_rm or attr_rp or class_rp_by_inline:
         if class_rp_by_inline:
@@ -1 +1,3 @@
 from . import test_openupgradelib  # noqa: F401
+from . import test_openupgrade_tools  # noqa: F401
+from . import test_openupgrade_160  # noqa: F401
@@ -1,4 +1,166 @@
-from openupgradelib import openupgrade
+from unittest import mock
+
+from openupgradelib import openupgrade, openupgrade_merge_records
+
+
+def test_merge_records_unchanged_values(env):
+    """The target record isn't written when the merged values are the ones it
+    already has."""
+    category = env["res.partner.category"].create({"name": "Merge category"})
+    vals = {"ref": "MERGE", "color": 3, "category_id": [(6, 0, category.ids)]}
+    target = env["res.partner"].create(dict(vals, name="Target"))
+    source = env["res.partner"].create(dict(vals, name="Source"))
+    partner_class = type(env["res.partner"])
+    write = partner_class.write
+    written = []
+
+    def _write(self, vals):
+        if target in self:
+            written.append(vals)
+        return write(self, vals)
+
+    with mock.patch.object(partner_class, "write", _write):
+        openupgrade_merge_records.merge_records(
+            env,
+            "res.partner",
+            [source.id],
+            target.id,
+            field_spec={
+                "openupgrade_other_fields": "preserve",
+                "ref": "first_not_null",
+                "color": "max",
+                "active": "and",
+                "category_id": "merge",
+            },
+            delete=False,
+        )
+    assert not written
+
+
+def test_merge_records_unique_index_conflicts(env):
+    """Rows colliding on a unique index with a row of the target record, or
+    among them, stay on the merged records, and the rest are moved."""
+    env.cr.execute(
+        """CREATE TABLE openupgradelib_test_merge (
+            id serial PRIMARY KEY,
+            partner_id integer REFERENCES res_partner(id),
+            code varchar,
+            UNIQUE (partner_id, code)
+        )"""
+    )
+    target = env["res.partner"].create({"name": "Merge target"})
+    source1 = env["res.partner"].create({"name": "Merge source 1"})
+    source2 = env["res.partner"].create({"name": "Merge source 2"})
+    env.cr.execute(
+        """INSERT INTO openupgradelib_test_merge (partner_id, code)
+        VALUES (%(target)s, 'A'), (%(source1)s, 'A'), (%(source1)s, 'B'),
+            (%(source2)s, 'B'), (%(source2)s, 'C')""",
+        {"target": target.id, "source1": source1.id, "source2": source2.id},
+    )
+    openupgrade_merge_records.merge_records(
+        env,
+        "res.partner",
+        [source1.id, source2.id],
+        target.id,
+        method="sql",
+        delete=False,
+    )
+    env.cr.execute(
+        """SELECT code, partner_id = %s, COUNT(*)
+        FROM openupgradelib_test_merge GROUP BY 1, 2""",
+        (target.id,),
+    )
+    assert set(env.cr.fetchall()) == {
+        ("A", True, 1),
+        ("A", False, 1),
+        ("B", True, 1),
+        ("B", False, 1),
+        ("C", True, 1),
+    }
+    env.cr.execute("DROP TABLE openupgradelib_test_merge")
+
+
+def test_merge_records_relation_table(env):
+    """Rows of a relation table (without id column) duplicating a row of the
+    target record are removed, also when another column of them differs."""
+    env.cr.execute(
+        """CREATE TABLE openupgradelib_test_merge_rel (
+            partner_id integer REFERENCES res_partner(id),
+            code varchar,
+            note varchar,
+            UNIQUE (partner_id, code)
+        )"""
+    )
+    target = env["res.partner"].create({"name": "Merge target"})
+    source = env["res.partner"].create({"name": "Merge source"})
+    env.cr.execute(
+        """INSERT INTO openupgradelib_test_merge_rel (partner_id, code, note)
+        VALUES (%(target)s, 'A', 'target'), (%(source)s, 'A', 'source'),
+            (%(source)s, 'B', 'source')""",
+        {"target": target.id, "source": source.id},
+    )
+    openupgrade_merge_records.merge_records(
+        env, "res.partner", [source.id], target.id, method="sql", delete=False
+    )
+    env.cr.execute("SELECT partner_id, code, note FROM openupgradelib_test_merge_rel")
+    assert set(env.cr.fetchall()) == {
+        (target.id, "A", "target"),
+        (target.id, "B", "source"),
+    }
+    env.cr.execute("DROP TABLE openupgradelib_test_merge_rel")
+
+
+def test_merge_records_unique_index_nulls(env):
+    """Rows are checked against every unique index including the column, and
+    rows with NULL values in the other columns of an index don't collide on
+    it, so they are moved to the target record."""
+    env.cr.execute(
+        """CREATE TABLE openupgradelib_test_merge (
+            id serial PRIMARY KEY,
+            partner_id integer REFERENCES res_partner(id),
+            code varchar,
+            ext varchar,
+            UNIQUE (partner_id, code),
+            UNIQUE (partner_id, ext)
+        )"""
+    )
+    target = env["res.partner"].create({"name": "Merge target"})
+    source = env["res.partner"].create({"name": "Merge source"})
+    env.cr.execute(
+        """INSERT INTO openupgradelib_test_merge (partner_id, code, ext)
+        VALUES (%(target)s, 'A', 'X'), (%(source)s, 'A', 'Y'),
+            (%(source)s, NULL, 'X'), (%(source)s, NULL, NULL),
+            (%(source)s, NULL, NULL), (%(source)s, 'B', 'Z')""",
+        {"target": target.id, "source": source.id},
+    )
+    openupgrade_merge_records.merge_records(
+        env, "res.partner", [source.id], target.id, method="sql", delete=False
+    )
+    env.cr.execute(
+        """SELECT partner_id, code, ext, COUNT(*)
+        FROM openupgradelib_test_merge GROUP BY 1, 2, 3"""
+    )
+    assert set(env.cr.fetchall()) == {
+        (target.id, "A", "X", 1),
+        (target.id, None, None, 2),
+        (target.id, "B", "Z", 1),
+        (source.id, "A", "Y", 1),
+        (source.id, None, "X", 1),
+    }
+    env.cr.execute("DROP TABLE openupgradelib_test_merge")
+
+
+def test_merge_records_fast_update(env):
+    """Many2one references changed through SQL still trigger the recomputation
+    of the stored fields depending on them."""
+    target = env["res.partner"].create({"name": "Target", "is_company": True})
+    source = env["res.partner"].create({"name": "Source", "is_company": True})
+    child = env["res.partner"].create({"name": "Child", "parent_id": source.id})
+    openupgrade_merge_records.merge_records(
+        env, "res.partner", [source.id], target.id, fast_update=True, delete=False
+    )
+    assert child.parent_id == target
+    assert child.commercial_partner_id == target
 
 
 @openupgrade.migrate()
@@ -9,3 +171,8 @@ def migrate(env, version):
     openupgrade.set_defaults(
         env.cr, env, {"res.partner": [("active", None)]}, force=True, use_orm=True
     )
+    test_merge_records_unchanged_values(env)
+    test_merge_records_unique_index_conflicts(env)
+    test_merge_records_relation_table(env)
+    test_merge_records_unique_index_nulls(env)
+    test_merge_records_fast_update(env)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+test_openupgrade_160
+----------------------------------
+
+Tests for `openupgradelib.openupgrade_160` module.
+"""
+import sys
+import unittest
+from functools import reduce
+
+import mock
+
+# This will be the odoo module
+odoo_mock = mock.Mock()
+odoo_mock.release.version_info = (16, 0, 0, "final", 0)
+odoo_mock.modules.migration.VALID_MIGRATE_PARAMS = [("env", "version")]
+odoo_modules = {
+    name: reduce(getattr, name.split(".")[1:], odoo_mock)
+    for name in (
+        "odoo",
+        "odoo.exceptions",
+        "odoo.modules",
+        "odoo.modules.migration",
+        "odoo.osv",
+        "odoo.tools",
+        "odoo.tools.translate",
+    )
+}
+
+with mock.patch.dict(sys.modules, odoo_modules):
+    from openupgradelib import openupgrade_160
+    from openupgradelib.openupgrade_tools import convert_html_fragment
+
+
+class TestOpenupgrade160(unittest.TestCase):
+    def _assert_same_conversion(self, fragment):
+        for pretty_print in (True, False):
+            self.assertEqual(
+                openupgrade_160.convert_string_bootstrap_4to5(fragment, pretty_print),
+                convert_html_fragment(
+                    fragment, openupgrade_160.ALL_REPLACEMENTS, pretty_print
+                ),
+            )
+
+    def test_convert_string_bootstrap_4to5_without_tokens(self):
+        for fragment in (
+            "<p>Hello <b>world</b></p>",
+            '<div class="container"><p class="lead">Hello</p></div>',
+            '<section class="o_website"><span title="x">Text</span></section>',
+        ):
+            self.assertIsNone(openupgrade_160._BS4_TOKEN_RE.search(fragment))
+            self.assertIs(
+                openupgrade_160.convert_string_bootstrap_4to5(fragment), fragment
+            )
+            self._assert_same_conversion(fragment)
+
+    def test_convert_string_bootstrap_4to5_with_tokens(self):
+        for fragment in (
+            '<a class="btn btn-block" data-toggle="collapse">Go</a>',
+            '<div class="media"><img class="float-left"/><p>Text</p></div>',
+            '<span class="badge badge-pill badge-primary">1</span>',
+            # Tokens only appearing in the text
+            "<p>Use data-toggle and float-left</p>",
+        ):
+            self.assertIsNotNone(openupgrade_160._BS4_TOKEN_RE.search(fragment))
+            self._assert_same_conversion(fragment)
+
+    def test_dedup_replacements(self):
+        first = {"selector": ".media", "class_rm": "media", "class_add": "d-flex"}
+        second = {"selector": ".ml-1", "class_rm": "ml-1", "class_add": "ms-1"}
+        self.assertEqual(
+            openupgrade_160._dedup_replacements([first, second, dict(first)]),
+            (first, second),
+        )
+        self.assertEqual(
+            len(openupgrade_160.ALL_REPLACEMENTS),
+            len(set(map(openupgrade_160._dedup_key, openupgrade_160.ALL_REPLACEMENTS))),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
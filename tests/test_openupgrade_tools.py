@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+test_openupgrade_tools
+----------------------------------
+
+Tests for `openupgradelib.openupgrade_tools` module.
+"""
+import threading
+import unittest
+
+from openupgradelib.openupgrade_tools import (
+    _get_compiled_selector,
+    convert_html_fragment,
+    convert_html_replacement_class_shortcut as _r,
+)
+
+REPLACEMENTS = (
+    _r(class_rm="btn-block", class_add="w-100"),
+    _r(class_rm="media", class_add="d-flex"),
+    _r(class_rm="float-left", class_add="float-start"),
+    _r(class_rm="card-deck", class_add="row"),
+)
+
+FRAGMENTS = (
+    # No class to replace
+    "<p>Hello <b>world</b></p>",
+    '<div class="container"><p class="lead">Hello</p></div>',
+    # Classes to replace, some of them in the same node
+    '<a class="btn btn-block">Go</a>',
+    '<div class="media"><img class="float-left"/><p>Text</p></div>',
+    '<div class="card-deck"><div class="card media">A</div></div>',
+    # Class names only appearing in the text or as part of other classes
+    '<p class="media-body">media float-left</p>',
+)
+
+
+def _without_skip(replacements):
+    """Same replacements, with selectors that can't be discarded through the
+    classes of the fragment, so all of them are evaluated."""
+    return [dict(spec, selector="*" + spec["selector"]) for spec in replacements]
+
+
+class TestOpenupgradeTools(unittest.TestCase):
+    def test_get_compiled_selector_cache(self):
+        selector = _get_compiled_selector(".media")
+        self.assertIs(selector, _get_compiled_selector(".media"))
+        # The same expression is compiled differently as XPath
+        self.assertIsNot(
+            _get_compiled_selector("div"), _get_compiled_selector("div", "xpath")
+        )
+
+    def test_get_compiled_selector_per_thread(self):
+        selector = _get_compiled_selector(".media")
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(_get_compiled_selector(".media"))
+        )
+        thread.start()
+        thread.join()
+        # Each thread compiles its own selectors
+        self.assertIsNot(selector, result[0])
+        self.assertIs(selector, _get_compiled_selector(".media"))
+
+    def test_convert_html_fragment_cached_selectors(self):
+        replacements = (
+            _r(class_rm="media", class_add="d-flex"),
+            {
+                "selector": "//*[@data-toggle]",
+                "selector_mode": "xpath",
+                "attr_rm": {"data-toggle"},
+            },
+        )
+        fragment = '<div class="media"><a data-toggle="collapse">Go</a></div>'
+        expected = '<div class="d-flex"><a>Go</a></div>'
+        # Later conversions reuse the compiled selectors
+        for _i in range(2):
+            self.assertEqual(
+                convert_html_fragment(fragment, replacements, False), expected
+            )
+
+    def test_convert_html_fragment_class_skip(self):
+        for fragment in FRAGMENTS:
+            for pretty_print in (True, False):
+                self.assertEqual(
+                    convert_html_fragment(fragment, REPLACEMENTS, pretty_print),
+                    convert_html_fragment(
+                        fragment, _without_skip(REPLACEMENTS), pretty_print
+                    ),
+                )
+
+    def test_convert_html_fragment_chained_replacements(self):
+        # A class added by a replacement can be removed by a later one
+        replacements = (
+            _r(class_rm="old", class_add="middle"),
+            _r(class_rm="middle", class_add="new"),
+        )
+        fragment = '<div class="old">Text</div>'
+        result = convert_html_fragment(fragment, replacements, False)
+        self.assertEqual(result, '<div class="new">Text</div>')
+        self.assertEqual(
+            result, convert_html_fragment(fragment, _without_skip(replacements), False)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()